@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""Script that keeps the latest value and a short history of recent values
+for every sensor publishing raw readings to the "readings/raw/#" topics on
+the local MQTT broker.  The values are served as JSON through an HTTP server
+listening on the localhost interface, for use by local dashboards and
+control logic.  Requests supported:
+
+    /sensors                        List of sensor IDs with readings
+    /reading/<sensor_id>            Most recent reading: {"ts": , "val": }
+    /stats/<sensor_id>?secs=<secs>  Rolling count, min, max and mean of the
+                                    readings in the last <secs> seconds
+                                    (default 300 seconds).
+
+Uses these settings from the Mini-Monitor settings file:
+    CURRENT_READING_PORT: the port the HTTP server listens on.
+    CURRENT_READING_HISTORY: seconds of recent readings kept for statistics.
+    CURRENT_READING_BUCKET: resolution, in seconds, of the statistics window.
+"""
+import sys
+import json
+import logging
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs, unquote
+import mqtt_current_reading
+import config_logging
+
+# Configure logging and log a restart of the app
+config_logging.configure_logging(logging, '/var/log/current_reading_server.log')
+logging.warning('current_reading_server has restarted')
+
+# The settings file is installed in the FAT boot partition of the Pi SD card,
+# so that it can be easily configured from the PC that creates the SD card.
+# Include that directory in the Path so the settings file can be found.
+sys.path.insert(0, '/boot/pi_logger')
+import settings
+
+# Start the thread that receives raw readings and keeps the recent values.
+cache = mqtt_current_reading.MQTTcurrentReading(
+    history_secs=getattr(settings, 'CURRENT_READING_HISTORY', 600),
+    bucket_secs=getattr(settings, 'CURRENT_READING_BUCKET', 10),
+)
+cache.start()
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parts = [unquote(p) for p in url.path.strip('/').split('/')]
+        try:
+            if parts == ['sensors']:
+                result = cache.sensor_ids()
+            elif len(parts) == 2 and parts[0] == 'reading':
+                ts, val = cache.get_current_reading(parts[1])
+                if ts is None:
+                    self.send_error(404, 'No readings for %s' % parts[1])
+                    return
+                result = {'ts': ts, 'val': val}
+            elif len(parts) == 2 and parts[0] == 'stats':
+                secs = float(parse_qs(url.query).get('secs', ['300'])[0])
+                result = cache.get_stats(parts[1], secs)
+                if result is None:
+                    self.send_error(404, 'No readings for %s' % parts[1])
+                    return
+            else:
+                self.send_error(404)
+                return
+        except:
+            logging.exception('Error processing request: %s' % self.path)
+            self.send_error(400)
+            return
+
+        body = json.dumps(result).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # route request logging to the application log at DEBUG level
+        logging.debug(format % args)
+
+
+server = ThreadingHTTPServer(('127.0.0.1', getattr(settings, 'CURRENT_READING_PORT', 8090)), RequestHandler)
+server.serve_forever()
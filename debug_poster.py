@@ -0,0 +1,88 @@
+"""Has a class that posts debug information to the Debug site from a
+background thread.  pi_logger.py uses it to post the first readings after a
+restart, with the IP addresses of the system, and meter_reader.py uses it to
+post the first reading received from each utility meter.  Posting waits for
+the network to become available, so neither script is held up at startup.
+"""
+import threading
+import time
+import queue
+import json
+import logging
+import subprocess
+
+# URL of the site that stores debug information posted by the Mini-Monitor
+DEBUG_URL = 'http://api.analysisnorth.com/debug_store'
+
+class DebugPoster(threading.Thread):
+    """Class that runs in a separate thread and posts debug information, such
+    as the first readings after a restart, to the Debug site.  Before the first
+    post, it waits for the network to become available.  Posting in this thread
+    means that data acquisition can start immediately, even at sites without
+    Internet access.
+    """
+
+    def __init__(self, url=DEBUG_URL, network_wait=60.0, timeout=10.0, max_queue=100):
+        """'url' is the URL to post the debug information to.
+        'network_wait' is the maximum number of seconds to wait for the network
+            to become available before attempting the first post.
+        'timeout' is the number of seconds allowed for each network probe and
+            each post.
+        'max_queue' is the maximum number of items waiting to be posted.  Items
+            posted while the queue is full are discarded.
+        """
+        threading.Thread.__init__(self)
+        self.daemon = True    # exit if main thread is gone
+        self.url = url
+        self.network_wait = network_wait
+        self.timeout = timeout
+        self.q = queue.Queue(maxsize=max_queue)
+
+    def wait_for_network(self):
+        """Waits for up to 'network_wait' seconds for the network to be
+        available.  Returns True if the network is available.
+        """
+        give_up = time.time() + self.network_wait
+        while True:
+            try:
+                subprocess.check_call(
+                    ['/usr/bin/curl', '--silent', '--output', '/dev/null', '--max-time', str(self.timeout), 'http://google.com'],
+                    timeout=self.timeout + 5,
+                )
+                logging.debug('Network is available')
+                return True
+            except:
+                # if curl returns non-zero error code, an exception is raised
+                if time.time() >= give_up:
+                    logging.warning('Network was not available after %s seconds.' % self.network_wait)
+                    return False
+                time.sleep(2)
+
+    def run(self):
+        """Waits for the network and then posts any items in the Queue.
+        """
+        self.wait_for_network()
+        # imported here so that loading the library doesn't delay startup
+        import requests
+
+        while True:
+            item, description = self.q.get(block=True)   # block until item is available
+            try:
+                data = item() if callable(item) else item
+                requests.post(self.url, data=json.dumps(data), headers={'content-type': 'application/json'}, timeout=self.timeout)
+                logging.debug('Successfully posted %s to Debug site.' % description)
+            except:
+                logging.exception('Error posting %s to Debug site.' % description)
+
+    def post(self, item, description='debug information'):
+        """Put an item in the queue to post.  'item' is an object that can be
+        converted to JSON, or a function, called just before posting, that
+        returns that object.  'description' describes the item in log messages.
+        Returns False if the item was discarded because the queue is full,
+        otherwise True.
+        """
+        try:
+            self.q.put_nowait((item, description))
+            return True
+        except queue.Full:
+            return False
@@ -15,6 +15,7 @@ import time, sys
 import threading, json, logging
 import requests
 import sqlite_queue
+from loglib import chunking
 
 requests.packages.urllib3.disable_warnings()
 
@@ -27,7 +28,9 @@ class HttpPoster:
                        reading_converter=None, 
                        post_q_filename='postQ.sqlite', 
                        post_thread_count=2, 
-                       post_time_file='/var/run/last_post_time'):
+                       post_time_file='/var/run/last_post_time',
+                       chunk_readings=None,
+                       chunk_bytes=None):
         """Parameters are:
         'post_URL': URL to post the data to.
         'reading_converter': function or callable to convert the format
@@ -38,9 +41,15 @@ class HttpPoster:
         'post_thread_count': number of post worker threads to start up.
         'post_time_file': name of the file to store the last time that
             a successful post occurred. (Unix timestamp).
+        'chunk_readings', 'chunk_bytes': if given, a list of readings passed
+            to add_readings() is split into separate posts having no more
+            than 'chunk_readings' readings and approximately 'chunk_bytes'
+            bytes of JSON.  Each post is retried independently.
         """
         
         self.reading_converter = reading_converter
+        self.chunk_readings = chunk_readings
+        self.chunk_bytes = chunk_bytes
 
         # create the queue used to store the readings.
         self.post_Q = sqlite_queue.SqliteReliableQueue(post_q_filename)
@@ -55,10 +64,17 @@ class HttpPoster:
         the server must understand that format.  If there is a converting
         function present, use it to convert the readings.
         """
+        if (self.chunk_readings or self.chunk_bytes) and isinstance(reading_data, list):
+            parts = list(chunking.chunks(reading_data, self.chunk_readings, self.chunk_bytes,
+                                         size=lambda reading: len(json.dumps(reading)) + 2))
+        else:
+            parts = [reading_data]
         if self.reading_converter:
-            self.post_Q.append(self.reading_converter(reading_data))
+            parts = [self.reading_converter(part) for part in parts]
+        if len(parts) == 1:
+            self.post_Q.append(parts[0])
         else:
-            self.post_Q.append(reading_data)
+            self.post_Q.extend(parts)
 
 
 class PostWorker(threading.Thread):
@@ -1,49 +1,285 @@
 """Periodically requests readings from reader objects and then posts summarized
-sets of the readings to an MQTT broker on localhost.
+sets of the readings to an MQTT broker on localhost.  Optionally, the raw
+readings from each read cycle are also published, with a limit on how often
+each sensor is published.  Raw readings that meet alarm rules are published
+immediately to the "readings/alarm" topics.  Each reader, or each group of sensors within a
+reader, is read on its own schedule.  Reads that come due together can be run
+one after another, or concurrently in a pool of threads with a timeout for
+each reader.
+
+Readers return either a list of reading tuples or, from read_batch(), a
+columnar readers.reading_batch.ReadingBatch.  The readings in a batch are
+grouped by sensor and added to each sensor's accumulator as arrays.
+
+Reads and logging are scheduled using the monotonic clock, so the schedule is
+not disturbed when the system clock is stepped or slewed (e.g. by ntpd after
+boot).  Readers stamp their readings with the wall-clock time.  The lateness
+of reads relative to their scheduled time (jitter) and the number of missed
+read deadlines are logged at each logging interval.  A reader (or Modbus
+device) whose reads keep failing is retried at increasing intervals, and its
+errors are summarized instead of logged in full on every read.
+
+The readings accumulated in the current logging interval are periodically
+saved to a checkpoint file and restored when the controller restarts, so a
+restart in the middle of an interval does not lose the interval's readings.
+
+Read latencies, errors, reading counts and the time spent logging are tracked
+in a loglib.metrics.Metrics object.  These can be posted each logging
+interval to the 'readings/final/metrics' topic, and are written to the log
+when the process receives the SIGUSR1 signal.
 """
-import logging, time
+import logging, time, math, heapq, os, pickle, signal, sys
+import concurrent.futures
 import numpy as np
 import readers.base_reader
+import readers.reading_batch
 import mqtt_poster
+from loglib import raw_publish
+from loglib import accumulate
+from loglib import sensor_settings
+from loglib import metrics
+from loglib import virtual_sensors
+from loglib import alarms
+from loglib import chunking
+
+def timed_read(read_func):
+    """Calls 'read_func' and returns a two-tuple: the readings and the number
+    of seconds the read took.  Used to run reads in the thread pool.
+    """
+    start = time.monotonic()
+    readings = read_func()
+    return readings, time.monotonic() - start
+
+class ReadTask:
+    """A group of sensors from one reader that is read on its own schedule.
+    See the read_groups() method of readers.base_reader.Reader.
+    """
+
+    def __init__(self, reader, name, read_func, interval, offset=None):
+        """'reader' is the Reader object and 'name' identifies the task in log
+        messages.  'read_func' is called with no arguments to read the sensors.
+        'interval' is the seconds between reads.  If 'offset' is None, the first
+        read occurs immediately; otherwise reads occur 'offset' seconds after
+        each multiple of 'interval' on the wall clock, e.g. interval=60,
+        offset=10 reads at 10 seconds past each minute.  'next_time' is
+        the time of the next read on the time.monotonic() clock.
+        """
+        self.reader = reader
+        self.name = name
+        self.read_func = read_func
+        self.interval = interval
+        self.offset = offset
+        self.next_time = None
+
+        # number of consecutive failed reads, and the time.monotonic() time
+        # before which reads are skipped because of those failures.
+        self.failures = 0
+        self.retry_time = None
+
+    def schedule_first(self, now):
+        """Sets the time of the first read, given the current time.monotonic()
+        time 'now'.  The offset is aligned to the wall clock once, here; after
+        that the schedule runs on the monotonic clock.
+        """
+        if self.offset is None:
+            self.next_time = now
+        else:
+            wall_now = time.time()
+            wall_next = wall_now - (wall_now % self.interval) + self.offset % self.interval
+            if wall_next < wall_now:
+                wall_next += self.interval
+            self.next_time = now + (wall_next - wall_now)
+
+    def schedule_next(self, now):
+        """Sets the time of the next read after the read scheduled at the current
+        'next_time'.  Reads that were missed because the prior reads took too
+        long are skipped, keeping the phase of the schedule.  Returns the number
+        of reads that were skipped.
+        """
+        self.next_time += self.interval
+        missed = 0
+        if self.next_time <= now:
+            missed = math.ceil((now - self.next_time) / self.interval)
+            if self.next_time + missed * self.interval <= now:
+                missed += 1
+            self.next_time += missed * self.interval
+        return missed
+
+class ScheduleStats:
+    """Tracks how closely reads follow their schedule during one logging
+    interval: the lateness of each read relative to its scheduled time, and
+    the number of scheduled reads that were skipped because earlier reads
+    ran past them.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.read_count = 0
+        self.late_sum = 0.0
+        self.late_max = 0.0
+        self.missed = 0
+
+    def record(self, lateness, missed=0):
+        """Records one read that started 'lateness' seconds after its scheduled
+        time, with 'missed' reads skipped after it.
+        """
+        self.read_count += 1
+        self.late_sum += lateness
+        if lateness > self.late_max:
+            self.late_max = lateness
+        self.missed += missed
+
+    def report(self):
+        """Logs the statistics for the interval and resets them.
+        """
+        if self.read_count:
+            msg = 'Read scheduling: %d reads, jitter mean %.1f ms, max %.1f ms, %d missed deadlines' % \
+                (self.read_count, self.late_sum / self.read_count * 1000.0, self.late_max * 1000.0, self.missed)
+            if self.missed:
+                logging.warning(msg)
+            else:
+                logging.info(msg)
+        self.reset()
 
 class LoggerController:
 
-    def __init__(self, read_interval=5, log_interval=600):
+    def __init__(self, read_interval=5, log_interval=600, settings=None):
         """Constructs the PeriodicReader object:
         'read_interval': the time interval between calls to the 'reader'
             read() method in seconds.
         'log_interval': the time interval between points when the readings
             are summarized and logged to the logging handlers in seconds.
+        'settings': the main settings module for the application, used for
+            optional features of the controller.
         """
 
         self.read_interval = read_interval
         self.log_interval = log_interval
 
+        # save the settings module if present, otherwise substitute a dummy
+        # object.
+        self._settings = settings if settings else readers.base_reader.DummySettings()
+
         # create a list of reader objects that read sensors.
         self.readers = []
 
+        # names of the readers, keyed on the reader object.  Used to
+        # identify the reader in topics and log messages.
+        self.reader_names = {}
+
         # create a list of handlers to be called with summarized readings
         # at each logging event.
         self.logging_handlers = []
         
-        # create a dictionary to hold all the readings collected during a 
+        # create a dictionary to summarize the readings collected during a
         # logging interval.  The keys of the dictionary will be the reading ID,
-        # and the values will be a two-tuple, the first value being the 
-        # reading_type from the readers.base_reader module, and the second value 
-        # will be a list of readings, each reading being a tuple of the form:
-        # (timestamp, value)
+        # and the values will be an accumulator object from the
+        # loglib.accumulate module, appropriate for the reading_type from the
+        # readers.base_reader module.  The accumulators keep running totals
+        # instead of the individual readings.
         self.read_data = {}
 
+        # Extra statistics to summarize for VALUE sensors, keyed on Sensor ID
+        # or Sensor ID pattern.  'sensor_stats' caches the statistics that
+        # apply to each Sensor ID.
+        self.value_stats = getattr(self._settings, 'VALUE_STATS', None)
+        self.sensor_stats = {}
+
+        # VALUE sensors that are summarized by their significant changes
+        # instead of their average.  Keyed on Sensor ID or Sensor ID pattern,
+        # with values that are dictionaries of 'threshold' and 'max_interval'.
+        self.change_sensors = getattr(self._settings, 'CHANGE_DETECT_SENSORS', None)
+
+        # VALUE sensors summarized with a time-weighted average, keyed on
+        # Sensor ID or Sensor ID pattern, with values that are dictionaries
+        # holding an optional 'max_gap'.
+        self.time_weighted_sensors = getattr(self._settings, 'TIME_WEIGHTED_SENSORS', None)
+
+        # COUNTER sensors that also have their rate summarized, keyed on Sensor
+        # ID or Sensor ID pattern, with values that are dictionaries of
+        # 'rollover' and 'rate_mult'.  'counter_rollovers' holds the rollover
+        # values declared by the readers, keyed on Sensor ID.
+        self.counter_rate_sensors = getattr(self._settings, 'COUNTER_RATE_SENSORS', None)
+        self.counter_rollovers = {}
+
+        # Virtual sensors computed from the readings of other sensors.
+        virtual_config = getattr(self._settings, 'VIRTUAL_SENSORS', None)
+        self.virtual = virtual_sensors.VirtualSensorEngine(virtual_config) if virtual_config else None
+
         # Create a poster object to post readings to the local MQTT broker.
         # It runs in a separate thread and must be started
         self.poster = mqtt_poster.MQTTposter()
         self.poster.start()
 
+        # If requested, set up publishing of raw readings.  A separate
+        # poster with QoS 0 and a bounded queue is used so that raw readings
+        # never delay or pile up behind the summarized readings.
+        if getattr(self._settings, 'RAW_PUBLISH', False):
+            self.raw_throttle = raw_publish.RawThrottle(
+                min_interval=getattr(self._settings, 'RAW_PUBLISH_MIN_INTERVAL', 10.0),
+                deadband=getattr(self._settings, 'RAW_PUBLISH_DEADBAND', 0.0),
+                max_interval=getattr(self._settings, 'RAW_PUBLISH_MAX_INTERVAL', 300.0),
+                sensor_options=getattr(self._settings, 'RAW_PUBLISH_SENSORS', None),
+            )
+            self.raw_poster = mqtt_poster.MQTTposter(qos=0, max_queue=100)
+            self.raw_poster.start()
+        else:
+            self.raw_throttle = None
+
+        # If there are alarm rules, readings meeting those rules are published
+        # as soon as they are read, through their own poster so they are not
+        # delayed behind other messages.
+        alarm_rules = getattr(self._settings, 'ALARM_RULES', None)
+        if alarm_rules:
+            self.alarms = alarms.AlarmEngine(alarm_rules)
+            self.alarm_poster = mqtt_poster.MQTTposter()
+            self.alarm_poster.start()
+        else:
+            self.alarms = None
+
         # track whether a call has been make to log readings before.
         self.first_log_call = True
 
+        # If requested, readers are run concurrently in a thread pool, which is
+        # created when the run() method starts.  'pending_reads' holds the
+        # reads that did not finish within their timeout, keyed on ReadTask,
+        # with values of (future, start time).
+        self.concurrent = getattr(self._settings, 'CONCURRENT_READERS', False)
+
+        # Maximum seconds between retries of a failing read task; 0 disables
+        # backing off.
+        self.backoff_max = getattr(self._settings, 'READ_BACKOFF_MAX', 600)
+        self.executor = None
+        self.pending_reads = {}
 
-    def add_reader(self, reader):
+        # statistics on the timing of reads, reported each logging interval.
+        self.schedule_stats = ScheduleStats()
+
+        # prefix of the metric names for each reader, keyed on reader
+        self.metric_prefixes = {}
+
+        # Checkpointing of the readings accumulated in the current logging
+        # interval.  'restored_log_due' is the wall-clock time the restored
+        # interval should be logged, or None if nothing was restored.
+        self.checkpoint_file = getattr(self._settings, 'CHECKPOINT_FILE', '/var/run/pi_logger_checkpoint.pkl')
+        self.checkpoint_interval = getattr(self._settings, 'CHECKPOINT_INTERVAL', 60)
+        self.restored_log_due = None
+
+        # Instrumentation of reads and logging, optionally posted each logging
+        # interval.
+        self.metrics = metrics.Metrics()
+        self.publish_metrics = getattr(self._settings, 'PUBLISH_METRICS', False)
+
+        # Limits on the number of readings and bytes in each MQTT message of
+        # summarized readings.  Larger sets of readings are split into several
+        # messages.
+        self.chunk_readings = getattr(self._settings, 'MQTT_CHUNK_READINGS', 1000)
+        self.chunk_bytes = getattr(self._settings, 'MQTT_CHUNK_BYTES', 100000)
+
+
+    def add_reader(self, reader, name=None):
         """Adds an object to the list of sensor readers.  Each reader object must have a 
         read() method that returns a list of readings. Each item in the list must be a 
         4-tuple of the form (timestamp, reading_id, reading_value, reading_type).  'timestamp'
@@ -51,68 +287,363 @@ class LoggerController:
         'value' is the reading value, and 'reading_type' is a constant indicating 
         the general class of reading (e.g. value, state, counter) from the 
         'readers.base_reader' module.
+        'name' identifies the reader, e.g. 'sys_info.SysInfo'; it defaults to the
+        class name of the reader.
         """
         self.readers.append(reader)
+        self.reader_names[reader] = name if name else reader.__class__.__name__
+        try:
+            self.counter_rollovers.update(reader.counter_rollovers())
+        except:
+            logging.exception('Error determining counter rollovers for %s' % self.reader_names[reader])
+        self.metric_prefixes[reader] = 'rdr_' + metrics.metric_name(self.reader_names[reader])
+
+    def publish_raw(self, reader, readings):
+        """Publishes the readings returned from one read() call of 'reader'
+        to the 'readings/raw/<reader name>' topic, skipping readings that are
+        throttled by the per-sensor interval and deadband limits.
+        """
+        self.post_raw(reader, self.raw_throttle.filter(readings))
+
+    def post_raw(self, reader, to_publish):
+        """Publishes the list of (ts, sensor_id, val) raw readings 'to_publish'
+        from 'reader' to the 'readings/raw/<reader name>' topic.
+        """
+        if len(to_publish):
+            post_str = '\n'.join(['%s\t%s\t%s' % (round(ts, 2), sensor_id, val) for ts, sensor_id, val in to_publish])
+            if not self.raw_poster.publish('readings/raw/%s' % self.reader_names[reader], post_str):
+                logging.debug('Raw reading queue is full; readings discarded.')
+
+    def stats_for_sensor(self, reading_id):
+        """Returns the extra statistics to compute for the VALUE sensor
+        'reading_id', from the VALUE_STATS setting.
+        """
+        stats = self.sensor_stats.get(reading_id)
+        if stats is None:
+            try:
+                stats = accumulate.check_stats(sensor_settings.lookup(self.value_stats, reading_id, ()))
+            except:
+                logging.exception('Bad VALUE_STATS setting for %s' % reading_id)
+                stats = ()
+            self.sensor_stats[reading_id] = stats
+        return stats
+
+    def publish_alarms(self, reader, readings):
+        """Publishes the readings from 'readings' that meet alarm rules to the
+        'readings/alarm/<reader name>' topic.  Timestamps are rounded as they
+        are in the summarized readings, so that an alarm reading that is also
+        in the summarized readings is recognized as a duplicate.
+        """
+        self.post_alarms(reader, self.alarms.check(readings))
+
+    def post_alarms(self, reader, alarm_readings):
+        """Publishes the list of (ts, sensor_id, val) alarm readings
+        'alarm_readings' from 'reader' to the 'readings/alarm/<reader name>'
+        topic.
+        """
+        if len(alarm_readings):
+            post_str = '\n'.join(['%s\t%s\t%s' % (round(ts, 2), sensor_id, val) for ts, sensor_id, val in alarm_readings])
+            self.alarm_poster.publish('readings/alarm/%s' % self.reader_names[reader], post_str)
+            logging.info('Published alarm readings: %s' % post_str.replace('\n', '; '))
+
+    def accumulator(self, reading_id, reading_type):
+        """Returns the accumulator for the sensor 'reading_id' in the current
+        logging interval, creating it for readings of type 'reading_type' if
+        needed.
+        """
+        acc = self.read_data.get(reading_id)
+        if acc is None:
+            stats = self.stats_for_sensor(reading_id) if self.value_stats else ()
+            change_opts = sensor_settings.lookup(self.change_sensors, reading_id) if self.change_sensors else None
+            rate_opts = sensor_settings.lookup(self.counter_rate_sensors, reading_id) if self.counter_rate_sensors else None
+            twa_opts = sensor_settings.lookup(self.time_weighted_sensors, reading_id) if self.time_weighted_sensors else None
+            if change_opts is not None and reading_type == readers.base_reader.VALUE:
+                acc = accumulate.ChangeAccumulator(
+                    change_opts.get('threshold'),
+                    change_opts.get('max_interval'),
+                    stats
+                )
+            elif twa_opts is not None and reading_type == readers.base_reader.VALUE:
+                acc = accumulate.TimeWeightedAccumulator(
+                    twa_opts.get('max_gap', 3 * self.read_interval),
+                    self.log_interval,
+                    stats
+                )
+            elif rate_opts is not None and reading_type == readers.base_reader.COUNTER:
+                acc = accumulate.CounterRateAccumulator(
+                    rate_opts.get('rollover', self.counter_rollovers.get(reading_id)),
+                    rate_opts.get('rate_mult', 1.0)
+                )
+            else:
+                acc = accumulate.make_accumulator(reading_type, stats)
+            self.read_data[reading_id] = acc
+        return acc
+
+    def add_reading(self, ts, reading_id, reading_val, reading_type):
+        """Adds one reading to the accumulator for its sensor.
+        """
+        self.accumulator(reading_id, reading_type).add(ts, reading_val)
+
+    def process_readings(self, reader, readings):
+        """Adds the readings returned from one read() call of 'reader' to the
+        reading data structure and publishes them as raw readings if requested.
+        'readings' can also be a ReadingBatch returned by read_batch().
+        """
+        if isinstance(readings, readers.reading_batch.ReadingBatch):
+            self.process_batch(reader, readings)
+            return
+        self.metrics.incr(self.metric_prefixes[reader] + '_readings', len(readings))
+        if self.alarms:
+            try:
+                self.publish_alarms(reader, readings)
+            except:
+                logging.exception('Error checking alarms for readings from %s' % self.reader_names[reader])
+        if self.virtual:
+            self.virtual.update(readings)
+        for ts, reading_id, reading_val, reading_type in readings:
+            if self.virtual and reading_id in self.virtual.suppressed:
+                # only used as a source for virtual sensors
+                continue
+            try:
+                self.add_reading(ts, reading_id, reading_val, reading_type)
+            except:
+                logging.exception('Error adding reading %s from %s' % (reading_id, reader))
+        if self.raw_throttle:
+            try:
+                self.publish_raw(reader, readings)
+            except:
+                logging.exception('Error publishing raw readings from %s' % self.reader_names[reader])
+
+    def process_batch(self, reader, batch):
+        """Does the same as process_readings() for the ReadingBatch 'batch'.  The
+        readings are grouped by sensor, and each sensor's readings are added to
+        its accumulator as arrays.  Alarm rules, raw publishing and virtual
+        sensors work on one reading at a time, so the readings are only
+        stepped through individually when one of those is enabled.
+        """
+        self.metrics.incr(self.metric_prefixes[reader] + '_readings', len(batch))
+        if len(batch) == 0:
+            return
+        sensor_ids = batch.table.ids
+        read_types = batch.table.types
+
+        if self.alarms or self.raw_throttle or self.virtual:
+            alarm_readings = []
+            raw_readings = []
+            for ts, ix, reading_val in batch.columns():
+                reading_id = sensor_ids[ix]
+                if self.alarms:
+                    try:
+                        if self.alarms.check_reading(ts, reading_id, reading_val):
+                            alarm_readings.append( (ts, reading_id, reading_val) )
+                    except:
+                        logging.exception('Error checking alarms for %s from %s' % (reading_id, self.reader_names[reader]))
+                if self.raw_throttle and self.raw_throttle.should_publish(ts, reading_id, reading_val):
+                    raw_readings.append( (ts, reading_id, reading_val) )
+                if self.virtual:
+                    self.virtual.update_reading(ts, reading_id, reading_val)
+            if alarm_readings:
+                try:
+                    self.post_alarms(reader, alarm_readings)
+                except:
+                    logging.exception('Error publishing alarm readings from %s' % self.reader_names[reader])
+            if raw_readings:
+                try:
+                    self.post_raw(reader, raw_readings)
+                except:
+                    logging.exception('Error publishing raw readings from %s' % self.reader_names[reader])
+
+        # Order the readings by sensor index, keeping each sensor's readings in
+        # time order, and find where each sensor's readings start.
+        indices = batch.indices
+        ts = batch.timestamps()
+        values = batch.values
+        if np.any(indices[1:] < indices[:-1]):
+            order = np.argsort(indices, kind='stable')
+            indices, ts, values = indices[order], ts[order], values[order]
+        sensor_ixs, starts = np.unique(indices, return_index=True)
+        ends = np.append(starts[1:], len(indices))
+        for ix, start, end in zip(sensor_ixs.tolist(), starts.tolist(), ends.tolist()):
+            reading_id = sensor_ids[ix]
+            if self.virtual and reading_id in self.virtual.suppressed:
+                # only used as a source for virtual sensors
+                continue
+            try:
+                acc = self.accumulator(reading_id, read_types[ix])
+                if end - start == 1:
+                    # a single reading is added faster without arrays
+                    acc.add(float(ts[start]), float(values[start]))
+                else:
+                    acc.add_many(ts[start:end], values[start:end])
+            except:
+                logging.exception('Error adding reading %s from %s' % (reading_id, reader))
+
+    def make_tasks(self):
+        """Returns a list of ReadTask objects, one for each read group of each
+        reader.  The read interval and offset of a reader can be set in the
+        READER_INTERVALS setting; otherwise the 'read_interval' of the controller
+        is used.
+        """
+        reader_intervals = getattr(self._settings, 'READER_INTERVALS', {})
+        tasks = []
+        for reader in self.readers:
+            name = self.reader_names[reader]
+            # the setting value is an interval or an (interval, offset) tuple
+            rdr_interval = reader_intervals.get(name, self.read_interval)
+            rdr_offset = None
+            if isinstance(rdr_interval, (tuple, list)):
+                rdr_interval, rdr_offset = rdr_interval
+            try:
+                groups = reader.read_groups()
+            except:
+                logging.exception('Error determining read groups for %s' % name)
+                groups = [(None, reader.read, None, None)]
+            for group_name, read_func, interval, offset in groups:
+                tasks.append(ReadTask(
+                    reader,
+                    name if group_name is None else '%s/%s' % (name, group_name),
+                    read_func,
+                    interval if interval else rdr_interval,
+                    offset if offset is not None else rdr_offset,
+                ))
+        return tasks
+
+    def read_timeout(self, task):
+        """Returns the number of seconds a read of 'task' can run before
+        it is considered timed out.
+        """
+        timeouts = getattr(self._settings, 'READER_TIMEOUTS', {})
+        default = getattr(self._settings, 'READER_TIMEOUT', None) or task.interval
+        return timeouts.get(self.reader_names[task.reader], default)
+
+    def read_sequential(self, tasks):
+        """Runs each of the read 'tasks' in turn, adding the readings
+        to the reading data structure.
+        """
+        for task in tasks:
+            try:
+                start = time.monotonic()
+                try:
+                    readings = task.read_func()
+                finally:
+                    duration = time.monotonic() - start
+                    self.metrics.record(self.metric_prefixes[task.reader], duration)
+                if duration > task.interval:
+                    logging.info('Slow read of %s: %.2f seconds' % (task.name, duration))
+                self.process_readings(task.reader, readings)
+                self.read_succeeded(task)
+            except:
+                self.read_failed(task)
+
+    def read_concurrent(self, tasks):
+        """Runs the read 'tasks' concurrently in the thread pool and waits for
+        each to complete, up to the reader's timeout.  A read that times out is
+        left running; the task is skipped when it next comes due if the read is
+        still running, and the readings are used once the read completes.
+        """
+        # Check on reads left running from prior cycles.  Start a new read for
+        # every task that does not have a read still running.
+        submitted = []
+        for task in tasks:
+            if task in self.pending_reads:
+                future, start = self.pending_reads[task]
+                if not future.done():
+                    logging.warning('Read of %s still running after %.2f seconds; skipping this read.' % (task.name, time.monotonic() - start))
+                    self.metrics.incr(self.metric_prefixes[task.reader] + '_skipped')
+                    continue
+                del self.pending_reads[task]
+                logging.warning('Timed out read of %s completed after %.2f seconds.' % (task.name, time.monotonic() - start))
+                self.collect_read(task, future)
+            start = time.monotonic()
+            future = self.executor.submit(timed_read, task.read_func)
+            submitted.append( (start + self.read_timeout(task), start, task, future) )
+
+        # Wait for each read in the order of their deadlines.
+        for deadline, start, task, future in sorted(submitted, key=lambda x: x[0]):
+            try:
+                future.result(timeout=max(0.0, deadline - time.monotonic()))
+            except concurrent.futures.TimeoutError:
+                logging.warning('Read of %s timed out after %.2f seconds.' % (task.name, time.monotonic() - start))
+                self.metrics.incr(self.metric_prefixes[task.reader] + '_timeouts')
+                self.pending_reads[task] = (future, start)
+                continue
+            except:
+                # errors are logged in collect_read()
+                pass
+            self.collect_read(task, future)
+
+    def collect_read(self, task, future):
+        """Adds the readings from the completed read of 'task' in 'future' to the
+        reading data structure, logging any error raised by the read.
+        """
+        try:
+            readings, duration = future.result()
+            self.metrics.record(self.metric_prefixes[task.reader], duration)
+            if duration > task.interval:
+                logging.info('Slow read of %s: %.2f seconds' % (task.name, duration))
+            self.process_readings(task.reader, readings)
+            self.read_succeeded(task)
+        except:
+            self.read_failed(task)
+
+    def read_failed(self, task):
+        """Called from an exception handler when a read of 'task' fails.  After
+        repeated failures, the task is retried at doubling intervals up to
+        'backoff_max' seconds.  The first failure is logged with its traceback;
+        later consecutive failures are logged as one line at each retry.
+        """
+        self.metrics.incr(self.metric_prefixes[task.reader] + '_errors')
+        task.failures += 1
+        # the exponent is limited so a float interval cannot overflow after
+        # many failures
+        delay = task.interval * 2 ** min(task.failures - 1, 20)
+        if self.backoff_max:
+            delay = min(delay, max(self.backoff_max, task.interval))
+        else:
+            delay = task.interval
+        task.retry_time = time.monotonic() + delay if delay > task.interval else None
+        if task.failures == 1:
+            logging.exception('Error processing readings from %s' % task.name)
+        else:
+            # last line of the error message, which is the exception line if the
+            # message holds a traceback.
+            err_msg = str(sys.exc_info()[1]).strip().split('\n')[-1]
+            logging.warning('Read of %s has failed %d times in a row; retrying in %.1f seconds. Last error: %s' % (task.name, task.failures, delay, err_msg))
+
+    def read_succeeded(self, task):
+        """Called when a read of 'task' succeeds, ending any backoff.
+        """
+        if task.failures:
+            logging.warning('Read of %s succeeded after %d failures.' % (task.name, task.failures))
+            task.failures = 0
+            task.retry_time = None
 
     def log_readings(self):
         """Summarizes readings for one logging interval and posts them to
-        the MQTT broker. Timestamps are converted to integers.
+        the MQTT broker. Timestamps are rounded to hundredths of a second.
         """
-        
+
+        # add the readings of the virtual sensors computed once per interval
+        if self.virtual:
+            for ts, reading_id, reading_val, reading_type in self.virtual.end_interval():
+                self.add_reading(ts, reading_id, reading_val, reading_type)
+
         # summarize the readings
         summarized_readings = []
         new_read_data = {}   # the new reading data structure for next interval
-        for reading_id, data in list(self.read_data.items()):
-            reading_type, reading_list = data
-            if len(reading_list):
-                
-                try:
-                    logging.debug('%s: %d readings' % (reading_id, len(reading_list)))
-                    # make a separate numpy array of values and time stamps
-                    rd_arr = np.array(reading_list)
-                    ts_arr = rd_arr[:, 0]   # first column
-                    val_arr = rd_arr[:, 1]  # second column
-                    
-                    if reading_type == readers.base_reader.VALUE:
-                        # calculate the average value to log
-                        val_avg = val_arr.mean()
-                        # limit this value to 5 significant figures
-                        val_avg = float('%.5g' % val_avg)
-                        # calculate the average timestamp to log and convert to
-                        # integer seconds
-                        ts_avg = round(ts_arr.mean(), 2)
-                        summarized_readings.append( (ts_avg, reading_id, val_avg) )
-                        
-                    elif reading_type == readers.base_reader.STATE:
-                        # create a summarized reading for every state change, and 
-                        # also for the last reading even if it is not a state
-                        # change.  If this is the first logging event after reboot,
-                        # then also record the first reading
-
-                        # make list of the timestamps of the special readings to record (always the
-                        # last reading, and the first reading if a reboot just occurred.
-                        special_ts = [ts_arr[-1]]    # last reading
-                        if self.first_log_call:
-                            # on first logging call, record the initial reading also
-                            special_ts.append(ts_arr[0])
-
-                        last_state = val_arr[0]
-                        for ts, val in reading_list:
-                            if (val != last_state) or (ts in special_ts):
-                                summarized_readings.append( (round(ts, 2), reading_id, val) )
-                                last_state = val
-                        # need to save the last state for the next logging interval
-                        # so that the first state change can be detected.
-                        new_read_data[reading_id] = (readers.base_reader.STATE, [reading_list[-1]])
-                        
-                    elif reading_type == readers.base_reader.COUNTER:
-                        # with counter type readings, just take the last reading
-                        # in the logging interval.
-                        ts, val = reading_list[-1]
-                        summarized_readings.append( (round(ts, 2), reading_id, val) )
-                        
-                except:
-                    logging.exception('Error summarizing readings for logging.')
+        for reading_id, acc in list(self.read_data.items()):
+            try:
+                logging.debug('%s: %d readings' % (reading_id, acc.count))
+                summarized_readings += acc.summarize(reading_id, self.first_log_call)
+
+                # Some reading types, e.g. STATE, need to carry information
+                # into the next logging interval.
+                next_acc = acc.next_interval()
+                if next_acc is not None:
+                    new_read_data[reading_id] = next_acc
+
+            except:
+                logging.exception('Error summarizing readings for logging.')
 
         # Reset the reading data structure. The 'new_read_data' includes the 
         # last readings from the STATE type sensors.
@@ -123,56 +654,182 @@ class LoggerController:
         # Post summarized readings to the MQTT broker, if there
         # are any summarized readings
         if len(summarized_readings):
-            # convert readings into a string, one reading per line with
-            # tab-delimited fields
-            post_str = '\n'.join([ '%s\t%s\t%s' % (ts, sensor_id, val) for ts, sensor_id, val in summarized_readings])
+            # convert readings into lines with tab-delimited fields
+            lines = [ '%s\t%s\t%s' % (ts, sensor_id, val) for ts, sensor_id, val in summarized_readings]
             try:
-                self.poster.publish('readings/final/pi_logger', post_str)
-                logging.debug(f'logger_controller MQTT post: {post_str}')
+                self.publish_lines('readings/final/pi_logger', lines)
             except:
                 logging.exception('Error posting readings to MQTT broker.')
 
+    def publish_lines(self, topic, lines):
+        """Publishes the reading 'lines' to 'topic' on the MQTT broker, one
+        reading per line in the message payload.  The lines are split into
+        several messages if needed to meet the 'chunk_readings' and
+        'chunk_bytes' limits.
+        """
+        for chunk in chunking.chunks(lines, self.chunk_readings, self.chunk_bytes, size=lambda line: len(line) + 1):
+            post_str = '\n'.join(chunk)
+            self.poster.publish(topic, post_str)
+            logging.debug(f'logger_controller MQTT post: {post_str}')
+
+    def post_metrics(self):
+        """Posts the metrics for the logging interval to the
+        'readings/final/metrics' topic of the MQTT broker, and resets them.
+        Sensor IDs are the metric names prefixed with the Logger ID, e.g.
+        'test_rdr_sys_info_SysInfo_p99_ms'.
+        """
+        if self.publish_metrics:
+            ts = round(time.time(), 2)
+            logger_id = getattr(self._settings, 'LOGGER_ID', 'test')
+            lines = ['%s\t%s_%s\t%s' % (ts, logger_id, name, val) for name, val in self.metrics.values()]
+            self.publish_lines('readings/final/metrics', lines)
+        self.metrics.reset()
+
+    def save_checkpoint(self, log_due):
+        """Saves the readings accumulated in the current logging interval to
+        the checkpoint file.  'log_due' is the wall-clock time when the
+        interval will be logged.  The file is written to a temporary name and
+        then renamed so that a crash does not leave a partial file.
+        """
+        try:
+            state = dict(
+                saved=time.time(),
+                log_due=log_due,
+                first_log_call=self.first_log_call,
+                read_data=self.read_data,
+            )
+            tmp_name = self.checkpoint_file + '.tmp'
+            with open(tmp_name, 'wb') as fout:
+                pickle.dump(state, fout, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_name, self.checkpoint_file)
+        except:
+            logging.exception('Error saving checkpoint to %s' % self.checkpoint_file)
+
+    def load_checkpoint(self):
+        """Restores the readings from the checkpoint file if it was saved less
+        than one logging interval ago.
+        """
+        if not os.path.exists(self.checkpoint_file):
+            return
+        try:
+            with open(self.checkpoint_file, 'rb') as fin:
+                state = pickle.load(fin)
+            age = time.time() - state['saved']
+            if 0 <= age < self.log_interval:
+                self.read_data = state['read_data']
+                self.first_log_call = state['first_log_call']
+                self.restored_log_due = state['log_due']
+                logging.info('Restored readings for %d sensors from checkpoint saved %.0f seconds ago.' % (len(self.read_data), age))
+        except:
+            logging.exception('Error restoring checkpoint from %s' % self.checkpoint_file)
+
     def run(self):
         """Called to starting the reading and logging process.  Infinite loop 
         and does not return.
         """
 
-        # determine the time at which readings should be read and logged.
-        next_read_time = time.time()     # read right away
-        next_log_time = time.time() + self.log_interval
+        if self.checkpoint_interval:
+            self.load_checkpoint()
+
+        # dump the metrics to the log upon receiving SIGUSR1
+        try:
+            signal.signal(signal.SIGUSR1, lambda signum, frame: self.metrics.dump())
+        except ValueError:
+            # not running in the main thread
+            logging.warning('Unable to install SIGUSR1 handler for dumping metrics.')
+
+        tasks = self.make_tasks()
+        if self.concurrent:
+            self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, len(tasks)))
+
+        # The read tasks are kept in a heap ordered by the time of their next
+        # read.  Heap entries are (next read time, task index, task).  All
+        # scheduling uses the monotonic clock.
+        now = time.monotonic()
+        schedule = []
+        for ix, task in enumerate(tasks):
+            task.schedule_first(now)
+            heapq.heappush(schedule, (task.next_time, ix, task))
+
+        # determine the time at which readings should be logged.  If an
+        # interval was restored from a checkpoint, finish that interval.
+        next_log_time = now + self.log_interval
+        if self.restored_log_due is not None:
+            next_log_time = now + min(max(0.0, self.restored_log_due - time.time()), self.log_interval)
+        next_checkpoint_time = now + self.checkpoint_interval if self.checkpoint_interval else None
+
+        # converts a time.monotonic() time to a wall-clock time
+        def wall_time(mono_time):
+            return time.time() + (mono_time - time.monotonic())
 
         while True:
 
             # check to see if it's time to log readings.
-            if time.time() > next_log_time:
+            now = time.monotonic()
+            if now >= next_log_time:
                 next_log_time += self.log_interval
-                # when the clock is being sped up by ntpd, the new log time
-                # may be prior to the current time. If so, adjust it.
-                if next_log_time < time.time():
-                    next_log_time = time.time() + self.log_interval
+                if next_log_time <= now:
+                    # logging fell more than an interval behind; restart the
+                    # logging schedule from now.
+                    logging.warning('Logging of readings is behind schedule.')
+                    next_log_time = now + self.log_interval
+                log_start = time.monotonic()
                 try:
                     self.log_readings()
                 except:
+                    self.metrics.incr('log_errors')
                     logging.exception('Error logging readings.')
-
-            # calculate the next time a set of readings should be taken. If for
-            # some reason clock changed and moved forward substantially, get j
-            # resynched with it.
-            next_read_time = max(next_read_time + self.read_interval, time.time())
-
-            # Loop the through the readers, adding each reading returned to 
-            # the reading_data structure.
-            for reader in self.readers:
+                self.metrics.record('log', time.monotonic() - log_start)
+                self.schedule_stats.report()
                 try:
-                    for ts, reading_id, reading_val, reading_type in reader.read():
-                        # get the entry in the reading data structure for this sensor
-                        old_rd_type, rd_list = self.read_data.get(reading_id, (None, []))
-                        rd_list.append( (ts, reading_val) )
-                        self.read_data[reading_id] = (reading_type, rd_list)
+                    self.post_metrics()
                 except:
-                    logging.exception('Error processing readings from %s' % reader)
-                    
-            # wait until the next reading time
-            while time.time() < next_read_time:
-                time.sleep(0.1)
-                
\ No newline at end of file
+                    logging.exception('Error posting metrics.')
+                if next_checkpoint_time is not None:
+                    # save the checkpoint now so a restart does not restore
+                    # readings that have already been logged.
+                    self.save_checkpoint(wall_time(next_log_time))
+                    next_checkpoint_time = time.monotonic() + self.checkpoint_interval
+
+            # Gather the tasks that are due and schedule their next reads.
+            now = time.monotonic()
+            due = []
+            while schedule and schedule[0][0] <= now:
+                next_time, ix, task = heapq.heappop(schedule)
+                if task.retry_time is not None and now < task.retry_time:
+                    # backing off from failed reads
+                    task.schedule_next(now)
+                    heapq.heappush(schedule, (task.next_time, ix, task))
+                    continue
+                due.append(task)
+                missed = task.schedule_next(now)
+                self.schedule_stats.record(now - next_time, missed)
+                self.metrics.record('sched_jitter', now - next_time)
+                if missed:
+                    self.metrics.incr('sched_missed', missed)
+                heapq.heappush(schedule, (task.next_time, ix, task))
+
+            # Run the due tasks, adding each reading returned to the
+            # reading_data structure.
+            if due:
+                if self.executor:
+                    self.read_concurrent(due)
+                else:
+                    self.read_sequential(due)
+                if self.virtual:
+                    for ts, reading_id, reading_val, reading_type in self.virtual.end_cycle():
+                        self.add_reading(ts, reading_id, reading_val, reading_type)
+                self.metrics.record('cycle', time.monotonic() - now)
+
+            # periodically save the readings accumulated so far
+            if next_checkpoint_time is not None and time.monotonic() >= next_checkpoint_time:
+                self.save_checkpoint(wall_time(next_log_time))
+                next_checkpoint_time += self.checkpoint_interval
+                if next_checkpoint_time <= time.monotonic():
+                    next_checkpoint_time = time.monotonic() + self.checkpoint_interval
+
+            # sleep until the next read or logging time
+            wake_time = min(schedule[0][0], next_log_time) if schedule else next_log_time
+            delay = wake_time - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
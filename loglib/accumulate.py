@@ -0,0 +1,513 @@
+"""Classes that accumulate the readings of one sensor during a logging
+interval and summarize them at the end of the interval.  Each class keeps
+only running totals and a few recent values, so memory use does not grow
+with the number of readings in the interval.  There is one class for each
+of the reading types in the readers.base_reader module.  Readings are added
+one at a time with add(), or as arrays of timestamps and values with
+add_many(), which uses array operations instead of a call per reading.
+"""
+from array import array
+import numpy as np
+from readers.base_reader import VALUE, STATE, COUNTER
+from . import change_detect
+
+# Extra statistics that can be requested for VALUE sensors, in addition to
+# percentiles, which are given as 'p' followed by the percentile, e.g. 'p95'.
+STAT_NAMES = ('min', 'max', 'std', 'twa')
+
+def check_stats(stats):
+    """Returns the list of extra statistic names 'stats' as a tuple, raising a
+    ValueError if any of the names are not valid.
+    """
+    for stat in stats:
+        if stat in STAT_NAMES:
+            continue
+        try:
+            if stat[0] == 'p' and 0.0 <= float(stat[1:]) <= 100.0:
+                continue
+        except (ValueError, IndexError):
+            pass
+        raise ValueError('Unknown statistic: %s' % stat)
+    return tuple(stats)
+
+class ValueAccumulator:
+    """Accumulates VALUE readings.  The summary is one reading: the average
+    value, limited to 5 significant figures, at the average timestamp.
+    Optionally, extra statistics for the interval are included in the summary
+    as separate readings whose IDs have the statistic name as a suffix, e.g.
+    'outdoor_temp_max'.
+    """
+
+    reading_type = VALUE
+
+    def __init__(self, stats=()):
+        """'stats' is a list of the extra statistics to include in the summary,
+        from the names in STAT_NAMES plus percentiles such as 'p95'.  'twa' is
+        the time-weighted average, using trapezoidal integration between the
+        readings.  If extra statistics are requested, the readings in the
+        interval are stored so the statistics can be computed in one pass at
+        the end of the interval.
+        """
+        self.stats = tuple(stats)
+        # arrays of the timestamps and values in the interval, if needed.
+        self._ts = array('d') if self.stats else None
+        self._vals = array('d') if self.stats else None
+        self.count = 0
+        self.val_sum = 0.0
+        # Timestamps are summed as offsets from the first timestamp to
+        # preserve precision.
+        self.ts_first = None
+        self.ts_offset_sum = 0.0
+        self.val_min = None
+        self.val_max = None
+
+    def add(self, ts, val):
+        """Adds a reading with timestamp 'ts' and value 'val'.
+        """
+        val = float(val)
+        if self.count == 0:
+            self.ts_first = ts
+            self.val_min = val
+            self.val_max = val
+        else:
+            if val < self.val_min:
+                self.val_min = val
+            elif val > self.val_max:
+                self.val_max = val
+        self.count += 1
+        self.val_sum += val
+        self.ts_offset_sum += ts - self.ts_first
+        if self._ts is not None:
+            self._ts.append(ts)
+            self._vals.append(val)
+
+    def add_many(self, ts, vals):
+        """Adds the readings with the timestamps in the array 'ts' and the values
+        in the array 'vals'.
+        """
+        if len(vals) == 0:
+            return
+        ts = np.asarray(ts, dtype=np.float64)
+        vals = np.asarray(vals, dtype=np.float64)
+        val_min = float(vals.min())
+        val_max = float(vals.max())
+        if self.count == 0:
+            self.ts_first = float(ts[0])
+            self.val_min = val_min
+            self.val_max = val_max
+        else:
+            self.val_min = min(self.val_min, val_min)
+            self.val_max = max(self.val_max, val_max)
+        self.count += len(vals)
+        self.val_sum += float(vals.sum())
+        self.ts_offset_sum += float((ts - self.ts_first).sum())
+        if self._ts is not None:
+            self._ts.frombytes(ts.tobytes())
+            self._vals.frombytes(vals.tobytes())
+
+    def summarize(self, reading_id, first_call):
+        """Returns a list of summarized (ts, reading_id, val) readings for
+        the interval.  'first_call' is True if this is the first logging
+        interval since the program started.
+        """
+        if self.count == 0:
+            return []
+        # limit the average value to 5 significant figures
+        val_avg = float('%.5g' % (self.val_sum / self.count))
+        ts_avg = round(self.ts_first + self.ts_offset_sum / self.count, 2)
+        summary = [(ts_avg, reading_id, val_avg)]
+        for stat, val in self.extra_stats():
+            summary.append( (ts_avg, '%s_%s' % (reading_id, stat), float('%.5g' % val)) )
+        return summary
+
+    def extra_stats(self):
+        """Returns a list of (stat name, value) for the extra statistics of the
+        readings in the interval.
+        """
+        if not self.stats:
+            return []
+        ts = np.frombuffer(self._ts)
+        vals = np.frombuffer(self._vals)
+        pct_stats = [stat for stat in self.stats if stat[0] == 'p']
+        if pct_stats:
+            pct_vals = dict(zip(pct_stats, np.percentile(vals, [float(stat[1:]) for stat in pct_stats])))
+        results = []
+        for stat in self.stats:
+            if stat == 'min':
+                val = self.val_min
+            elif stat == 'max':
+                val = self.val_max
+            elif stat == 'std':
+                val = vals.std()
+            elif stat == 'twa':
+                span = ts[-1] - ts[0]
+                if span > 0:
+                    val = ((vals[1:] + vals[:-1]) * np.diff(ts)).sum() / 2.0 / span
+                else:
+                    val = vals.mean()
+            else:
+                val = pct_vals[stat]
+            results.append( (stat, float(val)) )
+        return results
+
+    def next_interval(self):
+        """Returns the accumulator to use for the next logging interval, or
+        None if no information is carried into the next interval.
+        """
+        return None
+
+
+class TimeWeightedAccumulator(ValueAccumulator):
+    """Accumulates VALUE readings and summarizes them with a time-weighted
+    average instead of the arithmetic mean, so that periods with more
+    frequent readings do not bias the average.  The average is computed
+    incrementally by trapezoidal integration between consecutive readings;
+    gaps between readings longer than 'max_gap' seconds are left out.  The
+    summary also includes the fraction of the logging interval covered by
+    the integration, with Sensor ID '<reading_id>_cov', so gaps in the
+    readings are visible.  Extra statistics can be requested as with
+    ValueAccumulator.
+    """
+
+    def __init__(self, max_gap=None, interval=None, stats=()):
+        """'max_gap' is the longest time in seconds between readings that is
+        integrated across; None means no limit.  'interval' is the length of
+        the logging interval in seconds, used to compute the coverage; if None,
+        the coverage is not reported.
+        """
+        super().__init__(stats)
+        self.max_gap = max_gap
+        self.interval = interval
+        self.prev = None          # prior (ts, val) reading
+        self.area = 0.0           # integral of value over 'covered' seconds
+        self.covered = 0.0
+
+    def add(self, ts, val):
+        """Adds a reading with timestamp 'ts' and value 'val'.
+        """
+        super().add(ts, val)
+        val = float(val)
+        if self.prev is not None:
+            prev_ts, prev_val = self.prev
+            dt = ts - prev_ts
+            if dt > 0 and (self.max_gap is None or dt <= self.max_gap):
+                self.area += (val + prev_val) * dt / 2.0
+                self.covered += dt
+        self.prev = (ts, val)
+
+    def add_many(self, ts, vals):
+        """Adds the readings with the timestamps in the array 'ts' and the values
+        in the array 'vals'.
+        """
+        if len(vals) == 0:
+            return
+        super().add_many(ts, vals)
+        ts = np.asarray(ts, dtype=np.float64)
+        vals = np.asarray(vals, dtype=np.float64)
+        if self.prev is not None:
+            ts = np.concatenate(([self.prev[0]], ts))
+            vals = np.concatenate(([self.prev[1]], vals))
+        dt = np.diff(ts)
+        use = dt > 0
+        if self.max_gap is not None:
+            use &= dt <= self.max_gap
+        self.area += float(((vals[1:] + vals[:-1]) * dt)[use].sum() / 2.0)
+        self.covered += float(dt[use].sum())
+        self.prev = (float(ts[-1]), float(vals[-1]))
+
+    def summarize(self, reading_id, first_call):
+        """Returns a list of summarized (ts, reading_id, val) readings for
+        the interval.  'first_call' is True if this is the first logging
+        interval since the program started.
+        """
+        summary = super().summarize(reading_id, first_call)
+        if summary:
+            ts_avg = summary[0][0]
+            if self.covered > 0:
+                summary[0] = (ts_avg, reading_id, float('%.5g' % (self.area / self.covered)))
+            if self.interval:
+                summary.append( (ts_avg, reading_id + '_cov', round(min(1.0, self.covered / self.interval), 3)) )
+        return summary
+
+    def next_interval(self):
+        """Returns the accumulator for the next logging interval.  It integrates
+        from the last reading of this interval, so the time between intervals
+        is not lost.
+        """
+        if self.prev is None:
+            return None
+        acc = TimeWeightedAccumulator(self.max_gap, self.interval, self.stats)
+        acc.prev = self.prev
+        return acc
+
+
+class ChangeAccumulator(ValueAccumulator):
+    """Accumulates VALUE readings for report-by-exception.  Instead of the
+    average, the summary has the readings that are significant changes, as
+    determined by loglib.change_detect.find_changes().  The first reading in
+    the interval is always included.  Extra statistics can be requested as
+    with ValueAccumulator.
+    """
+
+    def __init__(self, threshold=None, max_interval=None, stats=()):
+        """'threshold' is the change in value that is significant; if None, it is
+        2% of the range of the values in the interval.  'max_interval', if not
+        None, is the maximum number of readings between summary readings; a
+        reading is included if that many readings have passed without a
+        significant change.
+        """
+        super().__init__(stats)
+        self.threshold = threshold
+        self.max_interval = max_interval
+        self._ts = array('d')
+        self._vals = array('d')
+
+    def summarize(self, reading_id, first_call):
+        """Returns a list of summarized (ts, reading_id, val) readings for
+        the interval.  'first_call' is True if this is the first logging
+        interval since the program started.
+        """
+        if self.count == 0:
+            return []
+        ts = np.frombuffer(self._ts)
+        vals = np.frombuffer(self._vals)
+        ixs = change_detect.find_changes(vals, self.threshold, max_interval=self.max_interval)
+        summary = [(round(ts[ix], 2), reading_id, float(vals[ix])) for ix in ixs]
+        ts_avg = round(self.ts_first + self.ts_offset_sum / self.count, 2)
+        for stat, val in self.extra_stats():
+            summary.append( (ts_avg, '%s_%s' % (reading_id, stat), float('%.5g' % val)) )
+        return summary
+
+
+class StateAccumulator:
+    """Accumulates STATE readings.  The summary has a reading for every
+    state change, and also for the last reading even if it is not a state
+    change.  If this is the first logging interval after a restart, the
+    first reading is also included.  Only the state changes are stored.
+    """
+
+    reading_type = STATE
+
+    def __init__(self):
+        self.count = 0
+        self.first = None        # first (ts, val) reading
+        self.last = None         # last (ts, val) reading
+        # list of (index, ts, val) for the readings that are state changes.
+        # 'index' is the position of the reading in the interval.
+        self.changes = []
+
+    def add(self, ts, val):
+        """Adds a reading with timestamp 'ts' and value 'val'.
+        """
+        if self.count == 0:
+            self.first = (ts, val)
+        elif val != self.last[1]:
+            self.changes.append( (self.count, ts, val) )
+        self.last = (ts, val)
+        self.count += 1
+
+    def add_many(self, ts, vals):
+        """Adds the readings with the timestamps in the array 'ts' and the values
+        in the array 'vals'.  The state changes are found with one array
+        comparison instead of a comparison per reading.
+        """
+        n = len(vals)
+        if n == 0:
+            return
+        vals = np.asarray(vals)
+        prior = vals[0] if self.count == 0 else self.last[1]
+        changed = np.empty(n, dtype=bool)
+        changed[0] = vals[0] != prior
+        changed[1:] = vals[1:] != vals[:-1]
+        val_list = vals.tolist()
+        if self.count == 0:
+            self.first = (float(ts[0]), val_list[0])
+        for ix in np.flatnonzero(changed).tolist():
+            self.changes.append( (self.count + ix, float(ts[ix]), val_list[ix]) )
+        self.last = (float(ts[-1]), val_list[-1])
+        self.count += n
+
+    def summarize(self, reading_id, first_call):
+        """Returns a list of summarized (ts, reading_id, val) readings for
+        the interval.  'first_call' is True if this is the first logging
+        interval since the program started.
+        """
+        if self.count == 0:
+            return []
+        summary = []
+        last_ix_included = -1
+        if first_call:
+            # on first logging call, record the initial reading also
+            ts, val = self.first
+            summary.append( (round(ts, 2), reading_id, val) )
+            last_ix_included = 0
+        for ix, ts, val in self.changes:
+            summary.append( (round(ts, 2), reading_id, val) )
+            last_ix_included = ix
+        if last_ix_included != self.count - 1:
+            ts, val = self.last
+            summary.append( (round(ts, 2), reading_id, val) )
+        return summary
+
+    def next_interval(self):
+        """Returns the accumulator for the next logging interval.  It starts
+        with the last reading of this interval so that the first state change
+        in the next interval can be detected.
+        """
+        if self.count == 0:
+            return None
+        acc = StateAccumulator()
+        acc.add(*self.last)
+        return acc
+
+
+class CounterAccumulator:
+    """Accumulates COUNTER readings.  The summary is the last reading in the
+    interval.
+    """
+
+    reading_type = COUNTER
+
+    def __init__(self):
+        self.count = 0
+        self.last = None         # last (ts, val) reading
+
+    def add(self, ts, val):
+        """Adds a reading with timestamp 'ts' and value 'val'.
+        """
+        self.last = (ts, val)
+        self.count += 1
+
+    def add_many(self, ts, vals):
+        """Adds the readings with the timestamps in the array 'ts' and the values
+        in the array 'vals'.
+        """
+        if len(vals) == 0:
+            return
+        self.last = (float(ts[-1]), np.asarray(vals)[-1].item())
+        self.count += len(vals)
+
+    def summarize(self, reading_id, first_call):
+        """Returns a list of summarized (ts, reading_id, val) readings for
+        the interval.  'first_call' is True if this is the first logging
+        interval since the program started.
+        """
+        if self.count == 0:
+            return []
+        ts, val = self.last
+        return [(round(ts, 2), reading_id, val)]
+
+    def next_interval(self):
+        """Returns the accumulator to use for the next logging interval, or
+        None if no information is carried into the next interval.
+        """
+        return None
+
+
+class CounterRateAccumulator(CounterAccumulator):
+    """Accumulates COUNTER readings and, in addition to the last reading,
+    includes in the summary the rate of change of the counter over the
+    interval, with Sensor ID '<reading_id>_rate'.  The rate is measured from
+    the last reading of the prior interval, so no counts are lost between
+    intervals.  Counter rollovers and resets are handled, and only a few
+    values are stored no matter how many readings there are.
+    """
+
+    def __init__(self, rollover=None, rate_mult=1.0):
+        """'rollover' is the value at which the counter wraps back to zero, e.g.
+        2**16 for a 16-bit counter, or None if the counter does not roll over.
+        'rate_mult' multiplies the rate, which is otherwise in counts per
+        second; e.g. 3600 gives the rate per hour.
+        """
+        super().__init__()
+        self.rollover = rollover
+        self.rate_mult = rate_mult
+        self.start = None         # (ts, val) reading the rate is measured from
+        self.increase = 0.0       # increase in the counter since 'start'
+
+    def add(self, ts, val):
+        """Adds a reading with timestamp 'ts' and value 'val'.
+        """
+        if self.start is None:
+            self.start = (ts, val)
+        else:
+            prev_val = self.last[1] if self.last else self.start[1]
+            delta = val - prev_val
+            if delta < 0:
+                if self.rollover and delta + self.rollover < self.rollover / 2.0:
+                    # counter rolled over
+                    delta += self.rollover
+                else:
+                    # counter was reset; assume it started from zero
+                    delta = val
+            self.increase += delta
+        super().add(ts, val)
+
+    def add_many(self, ts, vals):
+        """Adds the readings with the timestamps in the array 'ts' and the values
+        in the array 'vals'.
+        """
+        if len(vals) == 0:
+            return
+        vals = np.asarray(vals)
+        if self.start is None:
+            self.start = (float(ts[0]), vals[0].item())
+            prior, current = vals[:-1], vals[1:]
+        else:
+            prev_val = self.last[1] if self.last else self.start[1]
+            prior, current = np.concatenate(([prev_val], vals[:-1])), vals
+        delta = current - prior
+        dropped = delta < 0
+        if dropped.any():
+            if self.rollover:
+                rolled = dropped & (delta + self.rollover < self.rollover / 2.0)
+            else:
+                rolled = np.zeros(len(delta), dtype=bool)
+            # rollovers wrap around; other drops are resets from zero
+            delta = np.where(rolled, delta + (self.rollover or 0), np.where(dropped, current, delta))
+        self.increase += float(delta.sum())
+        super().add_many(ts, vals)
+
+    def summarize(self, reading_id, first_call):
+        """Returns a list of summarized (ts, reading_id, val) readings for
+        the interval.  'first_call' is True if this is the first logging
+        interval since the program started.
+        """
+        summary = super().summarize(reading_id, first_call)
+        if summary:
+            ts, val = self.last
+            elapsed = ts - self.start[0]
+            if elapsed > 0:
+                rate = self.increase / elapsed * self.rate_mult
+                summary.append( (round(ts, 2), reading_id + '_rate', float('%.5g' % rate)) )
+        return summary
+
+    def next_interval(self):
+        """Returns the accumulator for the next logging interval, which measures
+        its rate from the last reading of this interval.
+        """
+        acc = CounterRateAccumulator(self.rollover, self.rate_mult)
+        acc.start = self.last if self.last else self.start
+        return acc if acc.start else None
+
+
+# Maps reading type to accumulator class
+ACCUMULATOR_CLASSES = {
+    VALUE: ValueAccumulator,
+    STATE: StateAccumulator,
+    COUNTER: CounterAccumulator,
+}
+
+def make_accumulator(reading_type, stats=()):
+    """Returns a new accumulator for readings of type 'reading_type'.
+    'stats' lists the extra statistics to compute for VALUE readings (see
+    ValueAccumulator); it is ignored for other reading types.  Raises a
+    ValueError for an unknown reading type.
+    """
+    try:
+        acc_class = ACCUMULATOR_CLASSES[reading_type]
+    except KeyError:
+        raise ValueError('Unknown reading type: %s' % reading_type)
+    if acc_class is ValueAccumulator:
+        return acc_class(stats)
+    return acc_class()
@@ -0,0 +1,103 @@
+"""Class that checks raw readings against alarm rules, so that readings
+indicating an alarm condition can be posted immediately instead of waiting
+for the end of the logging interval.
+"""
+from . import sensor_settings
+
+class AlarmEngine:
+    """Checks each raw reading against the alarm rule for its sensor.  A
+    rule is a dictionary with any of these keys:
+        'change': if True, a reading that differs from the prior reading of
+            the sensor is an alarm reading (e.g. a power outage or boiler
+            fault state).
+        'high', 'low': a reading that crosses above 'high' or below 'low' is
+            an alarm reading, as is the reading that returns past the limit
+            by more than 'deadband' (default 0), ending the alarm.
+        'max_rate': a reading that changed from the prior reading at more than
+            'max_rate' units per second is an alarm reading.
+    """
+
+    def __init__(self, rules):
+        """'rules' is a dictionary keyed on Sensor ID (or Sensor ID wildcard
+        pattern) whose values are the rule dictionaries described above.
+        """
+        self.rules = rules
+
+        # The rule applying to each sensor, keyed on Sensor ID, or None if no
+        # rule applies.  Looked up once per sensor.
+        self._sensor_rules = {}
+
+        # Last (ts, val) reading of each sensor with a rule, keyed on Sensor ID.
+        self._last = {}
+
+        # Limit ('high' or 'low') that each sensor is currently beyond, keyed
+        # on Sensor ID.  Sensors in the normal range are not present.
+        self._limit_state = {}
+
+    def rule(self, sensor_id):
+        """Returns the rule for 'sensor_id', or None if there is no rule.
+        """
+        if sensor_id not in self._sensor_rules:
+            self._sensor_rules[sensor_id] = sensor_settings.lookup(self.rules, sensor_id)
+        return self._sensor_rules[sensor_id]
+
+    def check(self, readings):
+        """Returns a list of the (ts, sensor_id, val) readings from 'readings'
+        that are alarm readings.  'readings' is a list of 4-tuples as
+        returned by a Reader's read() method.
+        """
+        alarms = []
+        for ts, sensor_id, val, read_type in readings:
+            if self.check_reading(ts, sensor_id, val):
+                alarms.append( (ts, sensor_id, val) )
+        return alarms
+
+    def check_reading(self, ts, sensor_id, val):
+        """Returns True if the reading 'val' at time 'ts' of 'sensor_id' is an
+        alarm reading.
+        """
+        rule = self.rule(sensor_id)
+        if rule is None:
+            return False
+        last = self._last.get(sensor_id)
+        self._last[sensor_id] = (ts, val)
+        return self.is_alarm(rule, sensor_id, ts, val, last)
+
+    def is_alarm(self, rule, sensor_id, ts, val, last):
+        """Returns True if the reading 'val' at time 'ts' of 'sensor_id' is an
+        alarm reading according to 'rule'.  'last' is the prior (ts, val)
+        reading of the sensor, or None.
+        """
+        alarm = False
+
+        if 'high' in rule or 'low' in rule:
+            deadband = rule.get('deadband', 0.0)
+            high = rule.get('high')
+            low = rule.get('low')
+            state = self._limit_state.get(sensor_id)
+            if high is not None and val > high:
+                new_state = 'high'
+            elif low is not None and val < low:
+                new_state = 'low'
+            elif state == 'high' and val >= high - deadband:
+                new_state = state     # within deadband, still in alarm
+            elif state == 'low' and val <= low + deadband:
+                new_state = state
+            else:
+                new_state = None
+            if new_state != state:
+                alarm = True
+                if new_state:
+                    self._limit_state[sensor_id] = new_state
+                else:
+                    del self._limit_state[sensor_id]
+
+        if last is not None:
+            last_ts, last_val = last
+            if rule.get('change') and val != last_val:
+                alarm = True
+            max_rate = rule.get('max_rate')
+            if max_rate is not None and ts > last_ts and abs(val - last_val) / (ts - last_ts) > max_rate:
+                alarm = True
+
+        return alarm
@@ -0,0 +1,29 @@
+"""Function to split a large set of readings into chunks, so that each
+message or HTTP post stays within size limits and can be retried on its own.
+"""
+
+def chunks(items, max_count=None, max_bytes=None, size=len):
+    """Yields lists of consecutive items from the 'items' list.  Each list has
+    no more than 'max_count' items, and the sizes of its items, as returned by
+    the 'size' function, add to no more than 'max_bytes', except that a single
+    item larger than 'max_bytes' is yielded in a list by itself.  A limit of
+    None (or 0) is not applied.  No lists are yielded if 'items' is empty.
+    """
+    if not max_count and not max_bytes:
+        if len(items):
+            yield list(items)
+        return
+
+    chunk = []
+    chunk_bytes = 0
+    for item in items:
+        item_bytes = size(item) if max_bytes else 0
+        if chunk and ((max_count and len(chunk) >= max_count) or
+                      (max_bytes and chunk_bytes + item_bytes > max_bytes)):
+            yield chunk
+            chunk = []
+            chunk_bytes = 0
+        chunk.append(item)
+        chunk_bytes += item_bytes
+    if chunk:
+        yield chunk
@@ -0,0 +1,108 @@
+"""Lightweight counters and latency histograms used to instrument the
+logger's hot paths.  The values are kept for one reporting interval and
+can be converted into sensor readings for posting, or dumped to the log.
+"""
+import bisect
+import logging
+import time
+
+# Upper bounds of the histogram buckets in milliseconds.  Buckets are spaced
+# geometrically, four per doubling, from 0.1 ms to about 100 seconds, so the
+# reported percentiles are within about 19% of the true value.
+BUCKET_BOUNDS = [0.1 * 2 ** (i / 4.0) for i in range(81)]
+
+class Histogram:
+    """Histogram of latencies in milliseconds, with fixed buckets so that
+    recording is cheap and memory use is constant.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, ms):
+        """Records one latency of 'ms' milliseconds.
+        """
+        self.counts[bisect.bisect_left(BUCKET_BOUNDS, ms)] += 1
+        self.count += 1
+        self.total += ms
+        if ms > self.max:
+            self.max = ms
+
+    def percentile(self, pct):
+        """Returns an estimate of the 'pct' percentile latency in milliseconds:
+        the upper bound of the bucket holding that percentile, limited to the
+        maximum recorded latency.  Returns None if nothing has been recorded.
+        """
+        if self.count == 0:
+            return None
+        target = self.count * pct / 100.0
+        cum = 0
+        for ix, ct in enumerate(self.counts):
+            cum += ct
+            if cum >= target and ct:
+                bound = BUCKET_BOUNDS[ix] if ix < len(BUCKET_BOUNDS) else self.max
+                return min(bound, self.max)
+        return self.max
+
+
+class Metrics:
+    """A set of named counters and latency histograms.
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self.start = time.time()
+
+    def incr(self, name, n=1):
+        """Adds 'n' to the counter 'name'.
+        """
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def record(self, name, secs):
+        """Records a latency of 'secs' seconds in the histogram 'name'.
+        """
+        hist = self.histograms.get(name)
+        if hist is None:
+            hist = Histogram()
+            self.histograms[name] = hist
+        hist.record(secs * 1000.0)
+
+    def values(self):
+        """Returns a list of (name, value) for the counters and the histogram
+        summaries.  Each histogram produces '<name>_count', '<name>_p50_ms',
+        '<name>_p99_ms' and '<name>_max_ms' values.
+        """
+        vals = list(self.counters.items())
+        for name, hist in list(self.histograms.items()):
+            vals.append( ('%s_count' % name, hist.count) )
+            if hist.count:
+                vals.append( ('%s_p50_ms' % name, round(hist.percentile(50), 2)) )
+                vals.append( ('%s_p99_ms' % name, round(hist.percentile(99), 2)) )
+                vals.append( ('%s_max_ms' % name, round(hist.max, 2)) )
+        return sorted(vals)
+
+    def reset(self):
+        """Clears the counters and histograms to start a new interval.
+        """
+        self.counters = {}
+        self.histograms = {}
+        self.start = time.time()
+
+    def dump(self):
+        """Writes the current values to the log.
+        """
+        lines = ['%s: %s' % (name, val) for name, val in self.values()]
+        logging.warning('Metrics for the last %.0f seconds:\n    %s' % (time.time() - self.start, '\n    '.join(lines)))
+
+def metric_name(name):
+    """Returns 'name' with characters that are not letters, digits or
+    underscores replaced by underscores, for use in a Sensor ID.
+    """
+    return ''.join([c if c.isalnum() or c == '_' else '_' for c in name])
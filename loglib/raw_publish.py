@@ -0,0 +1,70 @@
+"""Class to limit the number of raw (unsummarized) readings that are
+published to the MQTT broker.
+"""
+from . import sensor_settings
+
+class RawThrottle:
+    """Decides which raw readings from a read cycle are published.  A
+    reading from a sensor is published if:
+        * it is the first reading from the sensor, or
+        * at least 'min_interval' seconds have passed since the last published
+          reading from the sensor, and the value has changed by at least
+          'deadband' from that last published value, or
+        * at least 'max_interval' seconds have passed since the last published
+          reading from the sensor.
+    'min_interval', 'deadband' and 'max_interval' can be set separately for
+    each sensor.
+    """
+
+    def __init__(self, min_interval=10.0, deadband=0.0, max_interval=300.0, sensor_options=None):
+        """'min_interval', 'deadband', 'max_interval' are the defaults for all
+        sensors.  'sensor_options' is a dictionary keyed on Sensor ID (or
+        Sensor ID wildcard pattern) whose values are dictionaries that override
+        the defaults for that sensor, e.g.:
+            {'test_pwr': dict(min_interval=2, deadband=5.0)}
+        """
+        self.defaults = dict(min_interval=min_interval, deadband=deadband, max_interval=max_interval)
+        self.sensor_options = sensor_options
+
+        # Options applying to each sensor, keyed on Sensor ID.  Looked up once
+        # per sensor.
+        self._options = {}
+
+        # Last published reading for each sensor, keyed on Sensor ID.  Values
+        # are (timestamp, value) tuples.
+        self._last = {}
+
+    def options(self, sensor_id):
+        """Returns a (min_interval, deadband, max_interval) tuple for 'sensor_id'.
+        """
+        opts = self._options.get(sensor_id)
+        if opts is None:
+            sensor_opts = dict(self.defaults)
+            sensor_opts.update(sensor_settings.lookup(self.sensor_options, sensor_id, {}))
+            opts = (sensor_opts['min_interval'], sensor_opts['deadband'], sensor_opts['max_interval'])
+            self._options[sensor_id] = opts
+        return opts
+
+    def filter(self, readings):
+        """Returns a list of the (ts, sensor_id, val) readings from 'readings'
+        that should be published.  'readings' is a list of 4-tuples as
+        returned by a Reader's read() method.
+        """
+        to_publish = []
+        for ts, sensor_id, val, read_type in readings:
+            if self.should_publish(ts, sensor_id, val):
+                to_publish.append( (ts, sensor_id, val) )
+        return to_publish
+
+    def should_publish(self, ts, sensor_id, val):
+        """Returns True if the reading 'val' at time 'ts' of 'sensor_id' should
+        be published, recording it as the last published reading if so.
+        """
+        last_ts, last_val = self._last.get(sensor_id, (None, None))
+        if last_ts is not None:
+            min_interval, deadband, max_interval = self.options(sensor_id)
+            elapsed = ts - last_ts
+            if 0 <= elapsed < max_interval and (elapsed < min_interval or abs(val - last_val) < deadband):
+                return False
+        self._last[sensor_id] = (ts, val)
+        return True
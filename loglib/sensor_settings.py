@@ -0,0 +1,21 @@
+"""Functions for looking up per-sensor options in the Settings file.
+Per-sensor options are dictionaries keyed on Sensor ID.  A key can also be
+a Unix shell-style wildcard pattern, e.g. '*_temp', so that one entry
+applies to a group of sensors.
+"""
+from fnmatch import fnmatchcase
+
+def lookup(sensor_options, sensor_id, default=None):
+    """Returns the value in the 'sensor_options' dictionary that applies to
+    'sensor_id'.  An exact Sensor ID key is used first; otherwise the first
+    wildcard pattern key (in dictionary order) matching the Sensor ID is
+    used.  If nothing matches, 'default' is returned.
+    """
+    if not sensor_options:
+        return default
+    if sensor_id in sensor_options:
+        return sensor_options[sensor_id]
+    for pattern, val in sensor_options.items():
+        if fnmatchcase(sensor_id, pattern):
+            return val
+    return default
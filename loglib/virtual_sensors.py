@@ -0,0 +1,199 @@
+"""Virtual sensors, whose values are computed from the readings of other
+sensors, e.g. the temperature difference between a supply and return sensor.
+Each virtual sensor has an expression that refers to its source sensors
+through short aliases.  The expression is compiled once.  It is evaluated
+either on every read cycle with the latest source values, or once per
+logging interval with NumPy arrays holding the source values from every read
+cycle in the interval.  The resulting readings are summarized like any other
+VALUE reading.
+"""
+import ast
+import logging
+import numpy as np
+from readers.base_reader import VALUE
+
+# Names other than the aliases that can be used in an expression
+EXPR_NAMES = {'np': np, 'abs': abs, 'min': min, 'max': max, 'round': round}
+
+class VirtualSensor:
+    """One virtual sensor.
+    """
+
+    def __init__(self, sensor_id, expr, inputs, mode='read', max_age=None):
+        """'sensor_id' is the Sensor ID of the virtual sensor.  'expr' is a Python
+        expression using the aliases that are the keys of the 'inputs'
+        dictionary; the values of 'inputs' are the Sensor IDs the aliases refer
+        to.  NumPy is available in the expression as 'np'.  'mode' is 'read' to
+        evaluate the expression on each read cycle, or 'interval' to evaluate it
+        once per logging interval on arrays of the source values.  If 'max_age'
+        is given, a source value older than 'max_age' seconds is not used.
+        Raises ValueError for an invalid expression or mode.
+        """
+        if mode not in ('read', 'interval'):
+            raise ValueError('Invalid mode for virtual sensor %s: %s' % (sensor_id, mode))
+        self.sensor_id = sensor_id
+        self.inputs = dict(inputs)
+        self.mode = mode
+        self.max_age = max_age
+        try:
+            self.code = compile(expr, '<virtual sensor %s>' % sensor_id, 'eval')
+        except SyntaxError as err:
+            raise ValueError('Invalid expression for virtual sensor %s: %s' % (sensor_id, err))
+        unknown = self.unknown_names(ast.parse(expr, mode='eval'))
+        if unknown:
+            raise ValueError('Unknown names in expression for virtual sensor %s: %s' % (sensor_id, ', '.join(unknown)))
+
+        # For 'interval' mode, the read cycle timestamps and source values
+        # accumulated during the interval; the values are keyed on alias.
+        self.ts_list = []
+        self.val_lists = {alias: [] for alias in self.inputs}
+
+        # True if an error in evaluating the expression has been logged, so
+        # that a persistent error is logged only once.
+        self.error_logged = False
+
+    def unknown_names(self, tree):
+        """Returns a sorted list of the names used in the parsed expression
+        'tree' that are not available when it is evaluated.  Bare names must be
+        aliases, names in EXPR_NAMES or variables of a comprehension, and
+        NumPy functions and constants must be used as 'np.<name>'.
+        """
+        nodes = list(ast.walk(tree))
+        bound = {node.id for node in nodes if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store)}
+        unknown = set()
+        for node in nodes:
+            if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load):
+                if node.id not in self.inputs and node.id not in EXPR_NAMES and node.id not in bound:
+                    unknown.add(node.id)
+            elif isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name) and node.value.id == 'np':
+                if not hasattr(np, node.attr):
+                    unknown.add('np.' + node.attr)
+        return sorted(unknown)
+
+    def evaluate(self, values):
+        """Returns the value of the expression, with the aliases set to the
+        'values' dictionary of values or arrays keyed on alias.
+        """
+        namespace = dict(EXPR_NAMES)
+        namespace.update(values)
+        return eval(self.code, {'__builtins__': {}}, namespace)
+
+
+class VirtualSensorEngine:
+    """Tracks the latest readings of the source sensors and computes the
+    virtual sensor readings.
+    """
+
+    def __init__(self, config):
+        """'config' is a dictionary keyed on virtual Sensor ID, with values that
+        are dictionaries of the VirtualSensor constructor arguments, plus an
+        optional 'suppress_sources' key.  If that is True, the source sensors
+        of the virtual sensor are not logged themselves.  Virtual sensors with
+        invalid settings are logged and skipped.
+        """
+        self.sensors = []
+        self.suppressed = set()
+        for sensor_id, opts in config.items():
+            opts = dict(opts)
+            suppress = opts.pop('suppress_sources', False)
+            try:
+                sensor = VirtualSensor(sensor_id, **opts)
+            except:
+                logging.exception('Error configuring virtual sensor %s' % sensor_id)
+                continue
+            self.sensors.append(sensor)
+            if suppress:
+                self.suppressed.update(sensor.inputs.values())
+
+        self.source_ids = set()
+        for sensor in self.sensors:
+            self.source_ids.update(sensor.inputs.values())
+
+        # latest (ts, val) of each source sensor, keyed on Sensor ID, and the
+        # source sensors updated in the current read cycle.
+        self.latest = {}
+        self.updated = set()
+
+    def update(self, readings):
+        """Records the source sensor values from a list of readings, which are
+        4-tuples as returned by a Reader's read() method.
+        """
+        for ts, sensor_id, val, read_type in readings:
+            self.update_reading(ts, sensor_id, val)
+
+    def update_reading(self, ts, sensor_id, val):
+        """Records the reading 'val' at time 'ts' of 'sensor_id' if it is a
+        source sensor.
+        """
+        if sensor_id in self.source_ids:
+            self.latest[sensor_id] = (ts, val)
+            self.updated.add(sensor_id)
+
+    def current_values(self, sensor):
+        """Returns (ts, values) for the virtual sensor 'sensor' where 'values' is
+        a dictionary of the latest source values keyed on alias, and 'ts' is
+        the time of the latest source reading.  Returns (None, None) if the
+        sensor should not be evaluated for this read cycle.
+        """
+        if not self.updated.intersection(sensor.inputs.values()):
+            return None, None
+        values = {}
+        ts_list = []
+        for alias, source_id in sensor.inputs.items():
+            if source_id not in self.latest:
+                return None, None
+            ts, val = self.latest[source_id]
+            values[alias] = val
+            ts_list.append(ts)
+        if sensor.max_age is not None and max(ts_list) - min(ts_list) > sensor.max_age:
+            return None, None
+        return max(ts_list), values
+
+    def end_cycle(self):
+        """Called at the end of each read cycle.  Returns a list of the readings
+        of the 'read' mode virtual sensors, as 4-tuples like those returned by
+        a Reader's read() method.  Also saves the source values for the
+        'interval' mode virtual sensors.
+        """
+        readings = []
+        for sensor in self.sensors:
+            ts, values = self.current_values(sensor)
+            if ts is None:
+                continue
+            if sensor.mode == 'read':
+                try:
+                    readings.append( (ts, sensor.sensor_id, float(sensor.evaluate(values)), VALUE) )
+                    sensor.error_logged = False
+                except:
+                    if not sensor.error_logged:
+                        logging.exception('Error computing virtual sensor %s' % sensor.sensor_id)
+                        sensor.error_logged = True
+            else:
+                sensor.ts_list.append(ts)
+                for alias, val in values.items():
+                    sensor.val_lists[alias].append(val)
+        self.updated = set()
+        return readings
+
+    def end_interval(self):
+        """Called at the end of each logging interval.  Returns a list of the
+        readings of the 'interval' mode virtual sensors, one for each read
+        cycle in the interval, computed with one evaluation of each expression
+        on arrays of the source values.
+        """
+        readings = []
+        for sensor in self.sensors:
+            if sensor.mode != 'interval' or len(sensor.ts_list) == 0:
+                continue
+            try:
+                values = {alias: np.array(vals, dtype=float) for alias, vals in sensor.val_lists.items()}
+                results = np.broadcast_to(sensor.evaluate(values), (len(sensor.ts_list),))
+                readings += [(ts, sensor.sensor_id, float(val), VALUE) for ts, val in zip(sensor.ts_list, results)]
+                sensor.error_logged = False
+            except:
+                if not sensor.error_logged:
+                    logging.exception('Error computing virtual sensor %s' % sensor.sensor_id)
+                    sensor.error_logged = True
+            sensor.ts_list = []
+            sensor.val_lists = {alias: [] for alias in sensor.inputs}
+        return readings
@@ -28,9 +28,8 @@ import signal
 import sys
 import time
 import logging
-import json
-import requests
 import mqtt_poster
+import debug_poster
 import config_logging
 
 # Configure logging and log a restart of the app
@@ -80,6 +79,11 @@ def set_last(meter_id, ts, val):
 mqtt = mqtt_poster.MQTTposter()
 mqtt.start()
 
+# Start the object that posts the first reading from each meter to the Debug
+# site, so posting doesn't stall reading of the rtlamr output.
+debug = debug_poster.DebugPoster()
+debug.start()
+
 # start the rtlamr program.
 rtlamr = subprocess.Popen(['/home/pi/gocode/bin/rtlamr', 
     '-gainbyindex=24',   # index 24 was found to be the most sensitive
@@ -146,21 +150,15 @@ while True:
         if ts_last is None:
             set_last(meter_id, ts_cur, read_cur)
             logging.info('First read for Meter # %s: %s' % (meter_id, read_cur))
-            try:
-                # Post the first reading to the Debug site.
-                first_read = {
-                    'Logger ID': settings.LOGGER_ID,
-                    'Meter Number': meter_id,
-                    'Meter Type': commod_type,
-                    'Value': read_cur,
-                }
-                requests.post(
-                    'http://api.analysisnorth.com/debug_store', 
-                    data=json.dumps(first_read), 
-                    headers={'content-type': 'application/json'},
-                )
-            except:
-                logging.warning('Error posting first meter reading from %s to Debug site.' % meter_id)
+            # Post the first reading to the Debug site.
+            first_read = {
+                'Logger ID': settings.LOGGER_ID,
+                'Meter Number': meter_id,
+                'Meter Type': commod_type,
+                'Value': read_cur,
+            }
+            if not debug.post(first_read, 'first meter reading from %s' % meter_id):
+                logging.warning('Debug post queue full; first meter reading from %s not posted.' % meter_id)
             continue
 
         if ts_cur > ts_last + settings.METER_POST_INTERVAL * 60.0:
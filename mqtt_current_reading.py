@@ -1,16 +1,136 @@
 """Has a class that listens for raw readings from the MQTT broker, and
 stores and allows retrieval of the most current reading for each sensor.
+Running statistics of the recent readings are also kept for each sensor, in
+time buckets, so that rolling statistics (min, max, mean) over the last N
+seconds can be retrieved.
 """
 import logging
+import math
 import threading
+import time
 import paho.mqtt.client as mqtt
 
+class SensorHistory:
+    """Running statistics of the recent readings of one sensor, kept for
+    fixed-length time buckets.  Each bucket holds the count, sum, minimum and
+    maximum of the readings with timestamps in the bucket, so adding a reading
+    updates one bucket, and a statistics query combines at most one entry per
+    bucket in the window, no matter how many readings have been received.
+    Storage is allocated once for the buckets covering 'history_secs'.
+    """
+
+    def __init__(self, history_secs=600, bucket_secs=10):
+        """'history_secs' is the number of seconds of history available for
+        statistics and 'bucket_secs' is the length of each time bucket in
+        seconds, which sets the resolution of the statistics window.
+        """
+        self.bucket_secs = bucket_secs
+        n = max(1, int(math.ceil(history_secs / bucket_secs)))
+        # For each bucket slot, the bucket number (timestamp // bucket_secs) it
+        # holds, or None if unused, and the statistics of its readings.  Slots
+        # are reused in a ring.
+        self._bucket = [None] * n
+        self._count = [0] * n
+        self._sum = [0.0] * n
+        self._min = [0.0] * n
+        self._max = [0.0] * n
+        self._latest = (None, None)
+
+    def add(self, ts, val):
+        """Adds a reading with timestamp 'ts' and value 'val', replacing the
+        statistics of the oldest bucket if the reading starts a new bucket.
+        Readings older than the history are ignored.
+        """
+        bucket = int(ts // self.bucket_secs)
+        slot = bucket % len(self._bucket)
+        slot_bucket = self._bucket[slot]
+        if slot_bucket != bucket:
+            if slot_bucket is not None and bucket < slot_bucket:
+                # too old to be kept
+                return
+            self._bucket[slot] = bucket
+            self._count[slot] = 1
+            self._sum[slot] = val
+            self._min[slot] = val
+            self._max[slot] = val
+        else:
+            self._count[slot] += 1
+            self._sum[slot] += val
+            if val < self._min[slot]:
+                self._min[slot] = val
+            elif val > self._max[slot]:
+                self._max[slot] = val
+        if self._latest[0] is None or ts >= self._latest[0]:
+            self._latest = (ts, val)
+
+    def latest(self):
+        """Returns the most recent reading as a (ts, val) tuple, or (None, None)
+        if no readings have been received.
+        """
+        return self._latest
+
+    def stats(self, secs, now=None):
+        """Returns a dictionary of statistics for the readings in the time
+        buckets that overlap the last 'secs' seconds prior to 'now' (defaults to
+        the current time), so the window is extended to the start of its first
+        bucket.  Keys are 'count', 'min', 'max' and 'mean'; the last three are
+        None if there are no readings in the window.
+        """
+        if now is None:
+            now = time.time()
+        last_bucket = int(now // self.bucket_secs)
+        first_bucket = max(int((now - secs) // self.bucket_secs), last_bucket - len(self._bucket) + 1)
+        count = 0
+        total = 0.0
+        val_min = None
+        val_max = None
+        for bucket in range(first_bucket, last_bucket + 1):
+            slot = bucket % len(self._bucket)
+            if self._bucket[slot] != bucket:
+                continue
+            count += self._count[slot]
+            total += self._sum[slot]
+            if val_min is None or self._min[slot] < val_min:
+                val_min = self._min[slot]
+            if val_max is None or self._max[slot] > val_max:
+                val_max = self._max[slot]
+        if count == 0:
+            return {'count': 0, 'min': None, 'max': None, 'mean': None}
+        return {
+            'count': count,
+            'min': val_min,
+            'max': val_max,
+            'mean': total / count,
+        }
+
+
 class MQTTcurrentReading(threading.Thread):
 
-    def __init__(self):
-        # Establish a dictionary for the for the most current readings to be
-        # stored in.
+    def __init__(self, history_secs=600, bucket_secs=10, host='localhost'):
+        """'history_secs' is the number of seconds of recent readings that
+        statistics are kept for, for each sensor, in time buckets 'bucket_secs'
+        seconds long.  'host' is the MQTT broker to subscribe to.
+        """
+        threading.Thread.__init__(self)
+        self.daemon = True    # exit if main thread is gone
+        self.history_secs = history_secs
+        self.bucket_secs = bucket_secs
+        self.host = host
+
+        # Establish a dictionary for the recent readings to be stored in.
+        # Keys are sensor IDs and values are SensorHistory objects.
         self._readings = {}
+        self._lock = threading.Lock()
+
+    def add_reading(self, ts, sensor_id, val):
+        """Stores one reading.
+        """
+        with self._lock:
+            hist = self._readings.get(sensor_id)
+            if hist is None:
+                hist = SensorHistory(self.history_secs, self.bucket_secs)
+                self._readings[sensor_id] = hist
+            hist.add(ts, val)
 
     def run(self):
 
@@ -22,23 +142,20 @@ class MQTTcurrentReading(threading.Thread):
             # Subscribing in on_connect() means that if we lose the connection and
             # reconnect then subscriptions will be renewed.
             # Messages on this topic are sets of readings.
-            client.subscribe("readings/raw/#", qos=1)
+            client.subscribe("readings/raw/#", qos=0)
 
         # The callback for when a PUBLISH message is received from the server.
         def on_message(client, userdata, msg):
             # Process message payload.  Each reading is on a separate line in the
             # payload.  The reading has 3 tab-delimited fields:
             #   Unix timestamp  -  Sensor ID  -  Sensor value
-            # Need to convert this to a list of 3-element tuples
-            reads = []
-            for line in msg.payload.split('\n'):
+            for line in msg.payload.decode('utf-8').split('\n'):
                 if len(line.strip())==0:
                     # skip blank lines
                     continue
                 try:
                     ts, sensor_id, val = line.split('\t')
-                    val = (float(ts), float(val))
-                    self._readings[sensor_id] = val
+                    self.add_reading(float(ts), sensor_id, float(val))
                 except:
                     logging.exception('Bad reading: %s' % line)
                     # continue with the next reading
@@ -48,11 +165,34 @@ class MQTTcurrentReading(threading.Thread):
         client.on_connect = on_connect
         client.on_message = on_message
 
-        client.connect('localhost')
+        # Connect in the network loop, so that if the broker is not running yet
+        # the connection is retried instead of raising an exception that would
+        # end this thread.
+        client.connect_async(self.host)
 
         # Blocking call that processes network traffic, dispatches callbacks and
-        # handles reconnecting.
-        client.loop_forever()
+        # handles reconnecting, including retrying the first connection.
+        client.loop_forever(retry_first_connection=True)
+
+    def sensor_ids(self):
+        """Returns a list of the sensor IDs that have readings.
+        """
+        with self._lock:
+            return list(self._readings.keys())
 
     def get_current_reading(self, sensor_id):
-        return self._readings.get(sensor_id, (None, None))
+        """Returns the most recent (ts, val) reading for 'sensor_id', or
+        (None, None) if there is no reading for that sensor.
+        """
+        with self._lock:
+            hist = self._readings.get(sensor_id)
+            return hist.latest() if hist else (None, None)
+
+    def get_stats(self, sensor_id, secs):
+        """Returns rolling statistics for 'sensor_id' over the last 'secs'
+        seconds; see SensorHistory.stats().  Returns None if there are no
+        readings for the sensor.
+        """
+        with self._lock:
+            hist = self._readings.get(sensor_id)
+            return hist.stats(secs) if hist else None
@@ -12,14 +12,19 @@ class MQTTposter(threading.Thread):
     unavailable.
     """
 
-    def __init__(self, host='localhost', port=1883):
+    def __init__(self, host='localhost', port=1883, qos=1, max_queue=0):
         """'host' is the hostname to publish to.
-        'port' is the port on the host to publish to."""
+        'port' is the port on the host to publish to.
+        'qos' is the MQTT Quality of Service level used for the messages.
+        'max_queue' is the maximum number of messages waiting to be published.
+            Messages published while the queue is full are discarded.  0 means
+            no limit."""
         threading.Thread.__init__(self)
         self.daemon = True    # exit if main thread is gone
         self.host = host
         self.port = port
-        self.q = queue.Queue()
+        self.qos = qos
+        self.q = queue.Queue(maxsize=max_queue)
 
     def run(self):
         """Processes (publishes) any items in the Queue.
@@ -34,7 +39,7 @@ class MQTTposter(threading.Thread):
             retry_wait = 1  # seconds
             while True:    # try to publish until successful
                 try:
-                    publish.single(topic, payload=payload, qos=1, hostname=self.host, port=self.port)
+                    publish.single(topic, payload=payload, qos=self.qos, hostname=self.host, port=self.port)
                 except socket.error:
                     # couldn't connect to MQTT broker, try again after short wait
                     time.sleep(retry_wait)
@@ -49,5 +54,11 @@ class MQTTposter(threading.Thread):
     def publish(self, topic, payload):
         """Put a message in the queue to publish.
         'topic' is the topic of the message and 'payload' is the payload.
+        Returns False if the message was discarded because the queue is full,
+        otherwise True.
         """
-        self.q.put((topic, payload))
+        try:
+            self.q.put_nowait((topic, payload))
+            return True
+        except queue.Full:
+            return False
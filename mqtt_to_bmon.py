@@ -3,6 +3,9 @@
 The script processes messages on the "readings/final/#"
 topics, those messages being a set of sensor readings.  The readings
 are posted to a BMON server through use of the httpPoster2 module.
+Messages on the "readings/alarm/#" topics hold readings that need to reach
+the server quickly; they are posted through a separate posting queue so they
+do not wait behind a backlog of other readings.
 """
 import sys
 import os
@@ -11,6 +14,7 @@ import logging.handlers
 from os.path import exists
 import shutil
 import httpPoster2
+import post_pipeline
 import paho.mqtt.client as mqtt
 import config_logging
 
@@ -25,6 +29,11 @@ logging.warning('mqtt_to_bmon has restarted')
 sys.path.insert(0, '/boot/pi_logger')
 import settings
 
+# ---- Create the optional pool of processes that parse received messages.
+# It is made before any threads are started, as its worker processes are
+# forked.  See post_pipeline.make_parse_pool().
+parse_pool = post_pipeline.make_parse_pool(getattr(settings, 'BMON_PARSE_PROCESSES', 0))
+
 # ---- Create the object that will post the readings to the HTTP server.
 # First copy over the saved copy of the database, since this DB is
 # created on RAM disk and is lost every reboot.
@@ -40,7 +49,9 @@ for i in range(2):
         poster = httpPoster2.HttpPoster(settings.POST_URL,
                                         reading_converter=httpPoster2.BMSreadConverter(settings.POST_STORE_KEY),
                                         post_q_filename=db_fname,
-                                        post_time_file='/var/run/last_post_time')
+                                        post_time_file='/var/run/last_post_time',
+                                        chunk_readings=getattr(settings, 'BMON_CHUNK_READINGS', 1000),
+                                        chunk_bytes=getattr(settings, 'BMON_CHUNK_BYTES', 100000))
         logging.debug('Created HttpPoster.')
         break
     except:
@@ -52,6 +63,24 @@ for i in range(2):
             logging.exception('Error creating Posting queue: %s. Terminating application.' % db_fname)
             sys.exit(1)
 
+# Create a separate poster for alarm readings.  It has its own posting queue
+# and worker, so alarm readings are posted ahead of any backlog in the main
+# queue.  Like the main queue, it is restored from its non-volatile backup.
+priority_db_fname = '/var/run/postQ_priority.sqlite'
+priority_db_fname_nv = '/var/local/postQ_priority.sqlite'
+if exists(priority_db_fname_nv):
+    shutil.copyfile(priority_db_fname_nv, priority_db_fname)
+    logging.debug('Restored priority Post queue.')
+try:
+    priority_poster = httpPoster2.HttpPoster(settings.POST_URL,
+                                             reading_converter=httpPoster2.BMSreadConverter(settings.POST_STORE_KEY),
+                                             post_q_filename=priority_db_fname,
+                                             post_thread_count=1,
+                                             post_time_file='/var/run/last_post_time')
+except:
+    logging.exception('Error creating priority Posting queue; alarm readings will use the main queue.')
+    priority_poster = None
+
 # ---- Start a client that will listen for MQTT messages
 
 # The callback for when the MQTT client receives a CONNACK response from the server.
@@ -61,28 +90,36 @@ def on_connect(client, userdata, flags, rc):
     # reconnect then subscriptions will be renewed.
     # Messages on this topic are sets of readings.
     client.subscribe("readings/final/#", qos=1)
+    client.subscribe("readings/alarm/#", qos=1)
  
+# ---- Create the filter that drops readings that are delivered more than once.
+# Its state is kept on the RAM disk so that it survives a restart of this
+# script.
+dup_filter = post_pipeline.DuplicateFilter(
+    window=getattr(settings, 'BMON_DEDUP_WINDOW', 3600),
+    max_entries=getattr(settings, 'BMON_DEDUP_MAX_ENTRIES', 20000),
+    state_file='/var/run/bmon_dedup.pkl',
+)
+
+# ---- Start the pipeline that parses received messages and writes the readings
+# to the posting queue in batches.  This keeps parsing and the slow disk I/O of
+# the posting queue out of the MQTT network loop.  Alarm readings go through
+# a separate priority stage to the priority posting queue.
+receiver = post_pipeline.start_pipeline(
+    poster,
+    priority_poster=priority_poster,
+    parse_pool=parse_pool,
+    max_batch=getattr(settings, 'BMON_BATCH_SIZE', 50),
+    max_wait=getattr(settings, 'BMON_BATCH_WAIT', 0.5),
+    dup_filter=dup_filter,
+    metrics_interval=getattr(settings, 'BMON_METRICS_INTERVAL', 600),
+)
+
 # The callback for when a PUBLISH message is received from the server.
 def on_message(client, userdata, msg):
-    # Process message payload.  Each reading is on a separate line in the
-    # payload.  The reading has 3 tab-delimited fields: 
-    #   Unix timestamp  -  Sensor ID  -  Sensor value
-    # Need to convert this to a list of 3-element tuples
-    reads = []
-    msg_str = str(msg.payload.decode('utf-8'))
-    try:
-        for line in msg_str.split('\n'):
-            if len(line.strip())==0:
-                # skip blank lines
-                continue
-            ts, sensor_id, val = line.split('\t')
-            reads.append( (float(ts), sensor_id, float(val)) )
-
-        # hand the readings to the HTTPposter if there are any
-        if len(reads):
-            poster.add_readings(reads)
-    except:
-        logging.exception(f'Bad reading: {msg_str}')
+    # Only queue the payload here; the pipeline stages parse the
+    # readings and hand them to the HTTPposter.
+    receiver.put(msg.payload, priority=msg.topic.startswith('readings/alarm/'))
 
 client = mqtt.Client()
 client.on_connect = on_connect
@@ -1,14 +1,17 @@
 #!/usr/bin/env python3
 """Main script to start and control the data logger.
 """
+import time
+start_time = time.time()     # used to report the time taken by startup
+
 from os.path import dirname, realpath, join, exists
 import os
-import sys, logging, logging.handlers, json
+import sys, logging, logging.handlers
 import shutil
-import time
-import subprocess
-import requests
+import concurrent.futures
 import logger_controller
+import readers.registry
+import debug_poster
 import scripts.utils
 import config_logging
 
@@ -52,56 +55,146 @@ import settings
 settings.VERSION = 3.9
 #***********************************************************************
 
+# Start the sensor readers listed in the settings file, add them to the
+# controller and post an initial set of readings to the debug URL.  The readers
+# are imported, created and initially read in parallel, except that readers that
+# use serial ports, including the readers that probe the FTDI serial ports, are
+# created one at a time, in the order listed, so they do not open a port while
+# another reader is probing it and they claim the same ports as they would if
+# created sequentially.  Sandboxed
+# readers are started last, from the main thread, after the thread pool has
+# shut down and before the controller (which starts the MQTT poster threads)
+# is created, so that their first child processes are not forked while the
+# pool or poster threads are running (readers that start their own threads can
+# still have them running).  A child process that is restarted later is forked
+# from a background thread of the SandboxReader.
+sandbox_readers = getattr(settings, 'SANDBOX_READERS', {})
+
+def start_reader(info):
+    """Creates and initially reads the reader described by 'info', a
+    readers.registry.RegisteredReader, passing in the settings module and the
+    settings already parsed by the registry for use by the class.  Returns the
+    reader object, the initial readings, and the seconds taken to create and
+    to read the reader.
+    """
+    start = time.time()
+    if info.name in sandbox_readers:
+        # run the reader in a child process that is killed if a read
+        # exceeds its deadline.
+        import readers.sandbox
+        reader_obj = readers.sandbox.SandboxReader(info.klass, settings, sandbox_readers[info.name], config=info.config)
+    else:
+        reader_obj = info.klass(settings, config=info.config)
+    create_secs = time.time() - start
+    start = time.time()
+    try:
+        readings = reader_obj.read()
+        logging.debug('Created and initially read %s' % info.name)
+    except:
+        logging.exception('Error getting initial readings from %s reader' % info.name)
+        readings = []
+    return reader_obj, readings, create_secs, time.time() - start
+
+def start_readers_in_order(infos):
+    """Starts the readers in the list of RegisteredReader objects 'infos' one
+    after another.  Returns a list of start_reader() results, with an exception
+    object in place of the results for a reader that failed to start.
+    """
+    results = []
+    for info in infos:
+        try:
+            results.append(start_reader(info))
+        except Exception as err:
+            logging.exception('Error starting %s reader' % info.name)
+            results.append(err)
+    return results
+
+def uses_serial(info):
+    """Returns True if the reader described by 'info' uses serial ports.
+    """
+    return getattr(info.klass, 'uses_ftdi_ports', False) or any(kind == 'serial' for kind, res_name, shared in info.resources)
+
+with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, len(settings.READERS))) as executor:
+
+    # import the reader modules
+    import_start = time.time()
+    import_futures = [executor.submit(readers.registry.load_class, reader_name) for reader_name in settings.READERS]
+    loaded = []
+    for reader_name, future in zip(settings.READERS, import_futures):
+        try:
+            loaded.append( (reader_name, future.result()) )
+        except:
+            logging.exception('Error importing %s reader' % reader_name)
+    import_secs = time.time() - import_start
+
+    # check the reader settings and resources, dropping invalid readers.  This
+    # is a list, in the order of the READERS setting, so a reader listed twice
+    # is started twice.
+    registered = readers.registry.register(loaded, settings)
+
+    # create and read the readers, with the start_reader() results in
+    # 'start_results' by position in 'registered'.  All of the serial port
+    # readers are started in one task.
+    start_results = [None] * len(registered)
+    threaded = [ix for ix, info in enumerate(registered) if info.name not in sandbox_readers]
+    serial_ixs = [ix for ix in threaded if uses_serial(registered[ix])]
+    serial_future = executor.submit(start_readers_in_order, [registered[ix] for ix in serial_ixs])
+    other_futures = {
+        ix: executor.submit(start_readers_in_order, [registered[ix]])
+        for ix in threaded if ix not in serial_ixs
+    }
+    for ix, result in zip(serial_ixs, serial_future.result()):
+        start_results[ix] = result
+    for ix, future in other_futures.items():
+        start_results[ix] = future.result()[0]
+
+sandboxed_ixs = [ix for ix, info in enumerate(registered) if info.name in sandbox_readers]
+for ix, result in zip(sandboxed_ixs, start_readers_in_order([registered[ix] for ix in sandboxed_ixs])):
+    start_results[ix] = result
+
 # Create the object to control the reading and logging process
 controller = logger_controller.LoggerController(read_interval=settings.READ_INTERVAL, 
-                                    log_interval=settings.LOG_INTERVAL)
+                                    log_interval=settings.LOG_INTERVAL,
+                                    settings=settings)
 logging.debug('Created logging controller.')
 
-# Add the sensor readers listed in the settings file to the controller
-# and post an initial set of readings to the debug URL.
+# Add the readers to the controller in the order listed in the settings file,
+# and report the time taken by each.  Readers that were not registered
+# because of import or configuration errors are reported as failed.
 init_readings = []
+timing_report = ['Reader modules imported in %.2f seconds.' % import_secs]
+started = list(zip(registered, start_results))
 for reader_name in settings.READERS:
-    
-    try:
-        # Dynamically import the module containing the reader class
-        parts = ('readers.' + reader_name).split('.')
-        mod = __import__('.'.join(parts[:-1]), fromlist=[parts[-1]])
-        
-        # get the reader class, instantiate it and add it to the controller, 
-        # passing in settings module for use by the class.  Also, get an 
-        # initial set of readings from the reader.
-        klass = getattr(mod, parts[-1])
-        reader_obj = klass(settings)
-        controller.add_reader(reader_obj)
-        try:
-            init_readings += reader_obj.read()
-            logging.debug('Created and initially read %s' % reader_name)
-        except:
-            logging.exception('Error getting initial readings from %s reader' % reader_name)
-        
-    except:
-        logging.exception('Error starting %s reader' % reader_name)
+    if started and started[0][0].name == reader_name:
+        info, result = started.pop(0)
+    else:
+        result = None
+    if result is None or isinstance(result, Exception):
+        timing_report.append('%s: failed to start' % reader_name)
+        continue
+    reader_obj, readings, create_secs, read_secs = result
+    controller.add_reader(reader_obj, reader_name)
+    init_readings += readings
+    timing_report.append('%s: created in %.2f seconds, first read in %.2f seconds' % (reader_name, create_secs, read_secs))
+first_reading_secs = time.time() - start_time
+timing_report.insert(0, 'Startup: %.2f seconds to first readings.' % first_reading_secs)
+logging.info('\n    '.join(timing_report))
 
-# wait for up to one minute for the network to be available
-for i in range(30):
-    try:
-        subprocess.check_call(['/usr/bin/curl', 'http://google.com'])
-        logging.debug('Network is available')
-        break
-    except:
-        # if curl returns non-zero error code, an exception is raised
-        # wait and try again
-        time.sleep(2)
-
-# post the initial readings to the Debug URL
-try:
-    # first, add the IP addresses assigned to this system to the readings
-    init_readings += scripts.utils.ip_addrs()
-    init_readings.append('Logger ID: %s' % settings.LOGGER_ID)
-    requests.post('http://api.analysisnorth.com/debug_store', data=json.dumps(init_readings), headers={'content-type': 'application/json'})
-    logging.debug('Successfully posted First Readings.')
-except:
-    logging.exception('Error posting initial readings to Debug URL.')
+# Post the initial readings to the Debug URL.  This is done by a background
+# thread that first waits for the network to be available, so that reading
+# starts immediately.
+def first_readings():
+    """Returns the initial readings plus the IP addresses assigned to this
+    system, which are determined when the post is made.
+    """
+    return init_readings + scripts.utils.ip_addrs() + [
+        'Logger ID: %s' % settings.LOGGER_ID,
+        'Startup seconds to first readings: %.1f' % first_reading_secs,
+    ]
+
+debug = debug_poster.DebugPoster()
+debug.start()
+debug.post(first_readings, 'initial readings')
 
 # If there are any readers active then run the controller.  Otherwise exit.
 if len(controller.readers):
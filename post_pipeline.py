@@ -0,0 +1,465 @@
+"""Classes and functions used by the mqtt_to_bmon.py script to move sets of
+readings received from the MQTT broker into the HTTP posting queue.  The
+work is split into a pipeline of stages connected by bounded queues:
+
+    receive:  the MQTT network loop only places received payloads into the
+              parse queue (see ReceiveStage).
+    parse:    a thread parses batches of payloads into readings, optionally
+              using a pool of worker processes (see ParseStage and
+              make_parse_pool()).
+    persist:  a thread drops readings that have already been received and
+              writes the rest to the posting queue in micro-batches, one
+              SQLite transaction per batch (see PersistStage).
+    priority: alarm payloads skip the parse and persist queues; a thread
+              parses them and writes them to a separate priority posting
+              queue (see PriorityStage).
+
+Each stage keeps throughput and queue depth metrics (see StageMetrics) so
+that a saturated stage can be identified.
+"""
+import os
+import time
+import threading
+import queue
+import logging
+import pickle
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+
+def parse_payload(payload):
+    """Parses the payload of a 'readings/final/#' MQTT message and returns
+    a list of (timestamp, sensor_id, value) tuples.  Each reading is on a
+    separate line in the payload.  The reading has 3 tab-delimited fields:
+        Unix timestamp  -  Sensor ID  -  Sensor value
+    'payload' can be bytes or a string.  Blank lines are skipped.  An
+    exception is raised if a line is badly formatted.
+    """
+    if isinstance(payload, bytes):
+        payload = payload.decode('utf-8')
+    reads = []
+    for line in payload.split('\n'):
+        if len(line.strip())==0:
+            # skip blank lines
+            continue
+        ts, sensor_id, val = line.split('\t')
+        reads.append( (float(ts), sensor_id, float(val)) )
+    return reads
+
+
+def parse_payload_safe(payload):
+    """Calls parse_payload() but traps errors.  Returns a two-tuple: the list
+    of readings (empty if an error occurred) and an error message (None if
+    no error occurred).  Suitable for running in a worker process.
+    """
+    try:
+        return parse_payload(payload), None
+    except Exception as err:
+        return [], f'Bad reading: {payload}, {err!r}'
+
+
+class DuplicateFilter:
+    """Drops readings that have already been received.  QoS 1 MQTT delivery
+    and the retries done by mqtt_poster.MQTTposter can deliver the same
+    reading more than once.  A reading is identified by its (timestamp,
+    sensor_id) pair.  The identifiers of recently received readings are kept
+    in an LRU set that is bounded both by age ('window' seconds since
+    the reading was received) and by size ('max_entries').  The set is saved
+    to 'state_file' so that it survives a restart of the process.
+    """
+
+    def __init__(self, window=3600, max_entries=20000, state_file=None, save_interval=60):
+        """'window': number of seconds a reading identifier is remembered.
+        'max_entries': maximum number of identifiers remembered; the least
+            recently seen identifiers are discarded first.
+        'state_file': file to save the remembered identifiers in, or None
+            to not save them.
+        'save_interval': minimum number of seconds between saves of the
+            'state_file'.
+        """
+        self.window = window
+        self.max_entries = max_entries
+        self.state_file = state_file
+        self.save_interval = save_interval
+
+        # keys are (timestamp, sensor_id), values are the time the reading
+        # was last received.  Ordered from least to most recently received.
+        self._seen = OrderedDict()
+        self._last_save = time.time()
+
+        # total number of duplicate readings dropped
+        self.dropped_count = 0
+
+        # the filter is used by both the persist stage and the priority stage.
+        self._lock = threading.Lock()
+
+        self.load()
+
+    def load(self):
+        """Restores the remembered identifiers from the state file, ignoring
+        any that are older than the time window.
+        """
+        if self.state_file is None or not os.path.exists(self.state_file):
+            return
+        try:
+            with open(self.state_file, 'rb') as fin:
+                entries = pickle.load(fin)
+            cutoff = time.time() - self.window
+            for key, recv_ts in entries:
+                if recv_ts >= cutoff:
+                    self._seen[key] = recv_ts
+            self._trim()
+            logging.debug('Restored %d reading IDs for duplicate detection.' % len(self._seen))
+        except:
+            logging.exception('Error restoring duplicate detection state from %s' % self.state_file)
+
+    def save(self):
+        """Saves the remembered identifiers to the state file.  The file is
+        written to a temporary name and then renamed so that a crash does
+        not leave a partial file.
+        """
+        if self.state_file is None:
+            return
+        try:
+            tmp_name = self.state_file + '.tmp'
+            with open(tmp_name, 'wb') as fout:
+                pickle.dump(list(self._seen.items()), fout, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_name, self.state_file)
+        except:
+            logging.exception('Error saving duplicate detection state to %s' % self.state_file)
+        self._last_save = time.time()
+
+    def _trim(self):
+        """Removes identifiers that are too old or that exceed the maximum
+        number of identifiers remembered.
+        """
+        cutoff = time.time() - self.window
+        while self._seen:
+            key, recv_ts = next(iter(self._seen.items()))
+            if recv_ts >= cutoff and len(self._seen) <= self.max_entries:
+                break
+            self._seen.popitem(last=False)
+
+    def filter(self, reads):
+        """Returns the list of readings from 'reads' that have not been received
+        before.  'reads' is a list of (timestamp, sensor_id, value) tuples.
+        """
+        with self._lock:
+            now = time.time()
+            new_reads = []
+            for read in reads:
+                key = (read[0], read[1])
+                if key in self._seen:
+                    self._seen.move_to_end(key)
+                    self.dropped_count += 1
+                else:
+                    new_reads.append(read)
+                self._seen[key] = now
+            self._trim()
+
+            if now - self._last_save >= self.save_interval:
+                self.save()
+
+        return new_reads
+
+
+class StageMetrics:
+    """Tracks the throughput and input queue depth of one pipeline stage.
+    The report() method returns a summary of the activity since the prior
+    report.
+    """
+
+    def __init__(self, name, in_q=None):
+        """'name' identifies the stage in reports.  'in_q' is the queue feeding
+        the stage, or None if the stage has no input queue.
+        """
+        self.name = name
+        self.in_q = in_q
+        self._lock = threading.Lock()
+        self._reset(time.time())
+
+    def _reset(self, now):
+        self._start = now
+        self._items = 0          # items (messages or reading sets) processed
+        self._busy = 0.0         # seconds spent processing
+        self._max_depth = 0      # maximum input queue depth seen
+
+    def record(self, item_ct, busy_secs):
+        """Records that 'item_ct' items were processed, taking 'busy_secs'
+        seconds.
+        """
+        with self._lock:
+            self._items += item_ct
+            self._busy += busy_secs
+            if self.in_q is not None:
+                self._max_depth = max(self._max_depth, self.in_q.qsize())
+
+    def report(self):
+        """Returns a string summarizing the stage activity since the last call,
+        and resets the counters.  Busy percentage near 100 or a queue depth
+        near the queue size indicates a saturated stage.
+        """
+        now = time.time()
+        with self._lock:
+            elapsed = max(now - self._start, 1e-6)
+            msg = '%s: %.2f items/s, %.1f%% busy' % (self.name, self._items / elapsed, 100.0 * self._busy / elapsed)
+            if self.in_q is not None:
+                msg += ', queue depth %d (max %d of %d)' % (self.in_q.qsize(), self._max_depth, self.in_q.maxsize)
+            self._reset(now)
+        return msg
+
+
+class ReceiveStage:
+    """The receive stage of the pipeline.  The put() method is called from
+    the MQTT network loop with each message payload, and only places the
+    payload in the parse queue, or in the priority queue for priority
+    payloads.
+    """
+
+    def __init__(self, out_q, priority_q=None):
+        """'out_q' is the queue feeding the parse stage.  'priority_q' is the
+        queue feeding the priority stage, or None if priority payloads go to
+        the parse stage like other payloads.
+        """
+        self.out_q = out_q
+        self.priority_q = priority_q
+        self.metrics = StageMetrics('receive')
+
+    def put(self, payload, priority=False):
+        """Adds a message payload to the parse queue, or to the priority queue
+        if 'priority' is True.  If the queue is full, this blocks until space
+        is available.
+        """
+        start = time.time()
+        out_q = self.priority_q if priority and self.priority_q is not None else self.out_q
+        try:
+            out_q.put_nowait(payload)
+        except queue.Full:
+            logging.warning('%s queue is full; waiting for space.' % ('Priority' if out_q is self.priority_q else 'Parse'))
+            out_q.put(payload)
+        self.metrics.record(1, time.time() - start)
+
+
+class Stage(threading.Thread):
+    """Base class for a pipeline stage that runs in its own thread and
+    processes batches of items taken from an input queue.  Subclasses
+    implement process_batch().
+    """
+
+    def __init__(self, name, in_q, max_batch=50, max_wait=0.5):
+        """'name' identifies the stage in metrics reports.
+        'in_q' is the queue holding items to be processed.
+        'max_batch': maximum number of items processed together.
+        'max_wait': maximum number of seconds an item waits for its batch
+            to fill.
+        """
+        threading.Thread.__init__(self)
+        self.daemon = True    # exit if main thread is gone
+        self.in_q = in_q
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.metrics = StageMetrics(name, in_q)
+
+    def next_batch(self):
+        """Blocks until at least one item is available and then returns
+        a list of items, collecting more until the batch is full or
+        the batch wait time has expired.
+        """
+        batch = [self.in_q.get(block=True)]
+        deadline = time.time() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.in_q.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def process_batch(self, batch):
+        """Processes a list of items from the input queue.  Must be overridden.
+        """
+        pass
+
+    def run(self):
+        while True:
+            batch = self.next_batch()
+            start = time.time()
+            try:
+                self.process_batch(batch)
+            except:
+                logging.exception('Error processing batch in %s stage.' % self.metrics.name)
+            self.metrics.record(len(batch), time.time() - start)
+
+
+def make_parse_pool(processes):
+    """Returns a pool of 'processes' worker processes for the ParseStage, or
+    None if 'processes' is 0.  The workers are forked, so that the main
+    script, which has no __main__ guard, is not re-run in them.  One task is
+    run on each worker before returning, so that the workers are forked now
+    instead of on the first parse; call this before any other threads are
+    started, as forking a process with running threads can deadlock on locks
+    held by those threads.
+
+    The pool is off by default: parsing tab-delimited lines is cheap
+    compared to pickling the payloads and readings to and from the workers,
+    so the pool only pays off if parsing in one thread cannot keep up.
+    """
+    if processes <= 0:
+        return None
+    pool = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('fork'))
+    list(pool.map(parse_payload_safe, [b''] * processes))
+    return pool
+
+
+class ParseStage(Stage):
+    """Parses batches of message payloads into lists of readings and places
+    them in the persist queue.  The parsing is done in this thread, or by a
+    pool of worker processes from make_parse_pool() if one is given.
+    """
+
+    def __init__(self, in_q, out_q, pool=None, max_batch=50, max_wait=0.1):
+        """'in_q' holds message payloads; 'out_q' receives lists of
+        (timestamp, sensor_id, value) readings, one list per payload.
+        'pool' is the pool of worker processes used for parsing, or None to
+        parse in this thread, which is the default.
+        """
+        Stage.__init__(self, 'parse', in_q, max_batch, max_wait)
+        self.out_q = out_q
+        self.pool = pool
+
+    def process_batch(self, batch):
+        if self.pool:
+            results = self.pool.map(parse_payload_safe, batch)
+        else:
+            results = map(parse_payload_safe, batch)
+        for reads, error in results:
+            if error:
+                logging.error(error)
+            if len(reads):
+                self.out_q.put(reads)
+
+
+class PersistStage(Stage):
+    """Writes lists of readings to the posting queue in batches:  a batch is
+    written when 'max_batch' reading lists have accumulated or 'max_wait'
+    seconds have passed since the first list of the batch arrived, whichever
+    comes first.  If a DuplicateFilter is provided, readings that have already
+    been received are dropped before they reach the posting queue.
+    """
+
+    def __init__(self, in_q, poster, max_batch=50, max_wait=0.5, dup_filter=None):
+        """'in_q' holds lists of (timestamp, sensor_id, value) readings.
+        'poster' is the httpPoster2.HttpPoster object that receives the
+        readings; it converts them into the format posted to the server.
+        'dup_filter': a DuplicateFilter object, or None to post all readings.
+        """
+        Stage.__init__(self, 'persist', in_q, max_batch, max_wait)
+        self.poster = poster
+        self.dup_filter = dup_filter
+
+    def process_batch(self, batch):
+        reads = []
+        for read_list in batch:
+            reads += read_list
+
+        if self.dup_filter:
+            read_ct = len(reads)
+            reads = self.dup_filter.filter(reads)
+            if len(reads) < read_ct:
+                logging.info('Dropped %d duplicate readings, %d dropped in total.' %
+                             (read_ct - len(reads), self.dup_filter.dropped_count))
+
+        # hand the readings to the HTTPposter if there are any.  This
+        # is one insert into the posting queue for the entire batch.
+        if len(reads):
+            self.poster.add_readings(reads)
+            logging.debug('%d reading sets, %d readings added to posting queue.' % (len(batch), len(reads)))
+
+
+class PriorityStage(Stage):
+    """Parses payloads holding alarm readings and writes the readings to the
+    priority posting queue, so they are posted ahead of any backlog in the
+    main posting queue.  The readings are recorded in the DuplicateFilter, if
+    provided, so the same readings arriving later in a summarized set are not
+    posted again.
+    """
+
+    def __init__(self, in_q, poster, max_batch=50, max_wait=0.1, dup_filter=None):
+        """'in_q' holds message payloads.  'poster' is the httpPoster2.HttpPoster
+        object with the priority posting queue.  'dup_filter': a DuplicateFilter
+        object, or None to post all readings.
+        """
+        Stage.__init__(self, 'priority', in_q, max_batch, max_wait)
+        self.poster = poster
+        self.dup_filter = dup_filter
+
+    def process_batch(self, batch):
+        reads = []
+        for payload in batch:
+            payload_reads, error = parse_payload_safe(payload)
+            if error:
+                logging.error(error)
+            reads += payload_reads
+
+        if self.dup_filter:
+            reads = self.dup_filter.filter(reads)
+
+        if len(reads):
+            self.poster.add_readings(reads)
+            logging.debug('%d priority readings added to priority posting queue.' % len(reads))
+
+
+class MetricsReporter(threading.Thread):
+    """Logs the metrics of each pipeline stage every 'interval' seconds.
+    """
+
+    def __init__(self, stages, interval=600):
+        """'stages' is a list of stage objects having a 'metrics' attribute.
+        """
+        threading.Thread.__init__(self)
+        self.daemon = True    # exit if main thread is gone
+        self.stages = stages
+        self.interval = interval
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            logging.info('Pipeline: ' + '; '.join([stage.metrics.report() for stage in self.stages]))
+
+
+def start_pipeline(poster, parse_pool=None, max_batch=50, max_wait=0.5,
+                   max_buffer=10000, dup_filter=None, metrics_interval=600,
+                   priority_poster=None):
+    """Creates and starts the parse, persist and priority stages and the
+    metrics reporter.  Returns the ReceiveStage object, whose put() method
+    should be called with each MQTT message payload.
+    'poster': the httpPoster2.HttpPoster that receives the readings.
+    'parse_pool': pool of worker processes used for parsing, from
+        make_parse_pool(), or None to parse in a thread.  The pool must be
+        made before any threads are started, including the HttpPoster
+        threads.
+    'max_batch', 'max_wait': batching limits for writes to the posting queue.
+    'max_buffer': size of each of the bounded queues between stages.
+    'dup_filter': a DuplicateFilter object, or None.
+    'metrics_interval': seconds between logging of stage metrics.
+    'priority_poster': the httpPoster2.HttpPoster that receives priority
+        readings, or None to handle priority payloads like other payloads.
+    """
+    parse_q = queue.Queue(maxsize=max_buffer)
+    persist_q = queue.Queue(maxsize=max_buffer)
+    parser = ParseStage(parse_q, persist_q, pool=parse_pool)
+    persister = PersistStage(persist_q, poster, max_batch=max_batch, max_wait=max_wait, dup_filter=dup_filter)
+    stages = [parser, persister]
+    if priority_poster:
+        priority_q = queue.Queue(maxsize=max_buffer)
+        stages.append(PriorityStage(priority_q, priority_poster, dup_filter=dup_filter))
+    else:
+        priority_q = None
+    receiver = ReceiveStage(parse_q, priority_q)
+    for stage in stages:
+        stage.start()
+    MetricsReporter([receiver] + stages, metrics_interval).start()
+    return receiver
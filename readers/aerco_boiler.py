@@ -40,6 +40,10 @@ def try_read(instrument, register, function_code=4, times=3):
 class BMS2reader(base_reader.Reader):
     """Class to read sensor and status values from a BMS II Boiler controller
     """
+
+    # This reader claims a port from 'available_ftdi_ports', so it is created
+    # one at a time with the other readers that do.
+    uses_ftdi_ports = True
     
     def add_reading(self, rd_name, rd_val, rd_type=base_reader.VALUE):
         """Adds a reading to the self.readings list of readings.  Add the 
@@ -3,11 +3,16 @@ from.
 """
 import glob
 
+from . import reading_batch
+
 # Reading Types
 VALUE = 1       # continuous analog value like temperature, voltage, etc.
 STATE = 2       # a reading that has discrete states, like On/Off.
 COUNTER = 3     # a reading that is a cumulative count
 
+# Default value in a settings schema for a setting that must be present.
+REQUIRED = object()
+
 
 class DummySettings:
     """An object that substitutes for the application settings module if no
@@ -26,15 +31,72 @@ class Reader(object):
     # this list if it is using the port.
     available_ftdi_ports = glob.glob('/dev/serial/by-id/*FTDI*')
 
-    def __init__(self, settings=None):
+    # Subclasses that claim a port from 'available_ftdi_ports' set this to
+    # True, so that they are not created at the same time as each other.
+    uses_ftdi_ports = False
+
+    # Settings used by the reader, keyed on setting name.  Values are
+    # (parse_function, default) tuples.  'parse_function' is called with the
+    # setting value and returns the form used by the reader, raising an
+    # exception if the value is invalid.  A 'default' of REQUIRED means the
+    # setting must be present.  See parse_settings().
+    settings_schema = {}
+
+    # True if the reader's read_batch() method is its native way of reading,
+    # so the logger should call it instead of read().  See read_batch().
+    supports_batch = False
+
+    def __init__(self, settings=None, config=None):
         """
         'settings' is the main settings module for the application.
+        'config' is the result of parse_settings() for 'settings', e.g. from the
+        reader registry, which has already checked it; if None, the settings
+        are parsed here.  Subclasses that override this constructor accept
+        'config' and pass it on.
         """
         
         # save the settings module if present, otherwise substitute a dummy
         # object with the LOGGER_ID setting.
         self._settings = settings if settings else DummySettings()
 
+        # the parsed settings from 'settings_schema', keyed on setting name.
+        self.config = config if config is not None else self.parse_settings(self._settings)
+
+    @classmethod
+    def parse_settings(cls, settings):
+        """Returns a dictionary, keyed on setting name, of the values of the
+        settings in 'settings_schema' after parsing.  Missing settings take
+        their default.  Raises ValueError if a required setting is missing or a
+        setting is invalid.
+        """
+        config = {}
+        for name, (parse_func, default) in cls.settings_schema.items():
+            if not hasattr(settings, name):
+                if default is REQUIRED:
+                    raise ValueError('The %s setting is required by %s.' % (name, cls.__name__))
+                config[name] = default
+                continue
+            try:
+                config[name] = parse_func(getattr(settings, name))
+            except Exception as err:
+                raise ValueError('Invalid %s setting for %s: %s' % (name, cls.__name__, err))
+        return config
+
+    @classmethod
+    def resources(cls, config):
+        """Returns a list of the hardware resources used by the reader, given
+        the 'config' returned by parse_settings().  Each resource is a tuple:
+
+            (kind, name, shared)
+
+        'kind' is the type of resource, e.g. 'serial', 'i2c', 'gpio' or 'usb', and
+        'name' identifies it, e.g. '/dev/ttyUSB0', '0x48' or 16.  'shared' is True
+        if the resource can be used by other readers that also mark it shared,
+        because the readers coordinate their access.  The default is no
+        resources.
+        """
+        return []
+
         
     def read(self):
         """The Reader subclass must override this method and return a list 
@@ -57,5 +119,71 @@ class Reader(object):
         Any errors that occur and are not trapped in this method will be trapped
         and logged in the logger_controller run() method that call this read()
         method.
+
+        Readers that override read_batch() instead get a read() method that
+        converts the batch to this list form.
+        """
+        if type(self).read_batch is not Reader.read_batch:
+            return self.read_batch().readings()
+
+    def read_batch(self):
+        """Returns the sensor readings as a reading_batch.ReadingBatch, a
+        columnar alternative to the list of tuples returned by read() that
+        avoids creating objects for each reading.  The batch refers to the
+        sensors through indices into the reader's 'sensor_table'.  Readers that
+        produce arrays of values can override this method and set
+        'supports_batch' to True, so that the logger calls this method instead
+        of read().  The default adapts the readings returned by read().
+        """
+        return reading_batch.ReadingBatch.from_readings(self.read(), self.sensor_table)
+
+    @property
+    def sensor_table(self):
+        """The reading_batch.SensorTable holding the Sensor IDs of the batches
+        returned by read_batch(), created on first use.
+        """
+        if '_sensor_table' not in self.__dict__:
+            self._sensor_table = reading_batch.SensorTable()
+        return self._sensor_table
+
+    @classmethod
+    def capabilities(cls):
+        """Returns a list of names of the optional features the reader
+        supports: 'groups' if it splits its sensors into separately scheduled
+        read groups, and 'batch' if it supports batched reads.
+        """
+        caps = []
+        if cls.read_groups is not Reader.read_groups:
+            caps.append('groups')
+        if cls.supports_batch:
+            caps.append('batch')
+        return caps
+
+    def read_groups(self):
+        """Returns a list of groups of sensors that can be read separately, each
+        on its own schedule.  Each item in the list is a tuple:
+
+            (group_name, read_function, read_interval, read_offset)
+
+        'group_name' is a string identifying the group, or None if the group is
+        the whole reader.  'read_function' is called with no arguments and 
+        returns a list of readings in the same format as the read() method.  
+        'read_interval' is the number of seconds between reads of the group and
+        'read_offset' is the number of seconds after the start of each interval
+        that the read should occur; either can be None to use the value
+        configured for the reader as a whole.
+
+        The default is one group that reads all sensors with the read() method,
+        or with the read_batch() method if 'supports_batch' is True; a read
+        function can return a ReadingBatch instead of a list.  Readers that talk
+        to several independent devices can override this.
+        """
+        return [(None, self.read_batch if self.supports_batch else self.read, None, None)]
+
+    def counter_rollovers(self):
+        """Returns a dictionary giving the rollover value of COUNTER sensors
+        that wrap back to zero when they reach a fixed value, e.g. 2**16 for a
+        16-bit counter.  Keys are Sensor IDs.  The logger uses these to compute
+        counter rates across rollovers.  The default is an empty dictionary.
         """
-        pass 
+        return {}
@@ -79,11 +79,15 @@ class DG700reader(base_reader.Reader):
     """Class to read pressure values from the DG-700.
     """
 
-    def __init__(self, settings=None):
+    # This reader claims a port from 'available_ftdi_ports', so it is created
+    # one at a time with the other readers that do.
+    uses_ftdi_ports = True
+
+    def __init__(self, settings=None, config=None):
         """Initialize the DG-700.
         """
         # Call constructor of base class
-        super(DG700reader, self).__init__(settings)
+        super(DG700reader, self).__init__(settings, config)
 
         # open the DG-700 serial port
         ser_port = open_DG()
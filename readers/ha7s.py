@@ -162,12 +162,17 @@ class HA7Sreader(base_reader.Reader):
     """Class that reads the sensors on a 1-wire bus with a HA7S master.
     The read() method performs the read action.
     """
+
+    # This reader claims a port from 'available_ftdi_ports', so it is created
+    # one at a time with the other readers that do.
+    uses_ftdi_ports = True
     
-    def __init__(self, settings=None):
-        """'settings' is the general settings file for the application.
+    def __init__(self, settings=None, config=None):
+        """'settings' is the general settings file for the application.  'config'
+        is passed to the base class; see base_reader.Reader.
         """
         # Call constructor of base class
-        super(HA7Sreader, self).__init__(settings)
+        super(HA7Sreader, self).__init__(settings, config)
 
         # find the FTDI port that connects to the HA7S, and then
         # remove it from the list of available FTDI ports.
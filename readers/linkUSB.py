@@ -64,12 +64,17 @@ class LinkUSBreader(base_reader.Reader):
     """Class that reads the sensors on a 1-wire bus with a LinkUSB master.
     The read() method performs the read action.
     """
+
+    # This reader claims a port from 'available_ftdi_ports', so it is created
+    # one at a time with the other readers that do.
+    uses_ftdi_ports = True
     
-    def __init__(self, settings=None):
-        """'settings' is the general settings file for the application.
+    def __init__(self, settings=None, config=None):
+        """'settings' is the general settings file for the application.  'config'
+        is passed to the base class; see base_reader.Reader.
         """
         # Call constructor of base class
-        super(LinkUSBreader, self).__init__(settings)
+        super(LinkUSBreader, self).__init__(settings, config)
 
         # find the FTDI port that connects to the LinkUSB, and then
         # remove it from the list of available FTDI ports.
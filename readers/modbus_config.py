@@ -0,0 +1,176 @@
+"""Parses the MODBUS_TARGETS and MODBUS_RTU_TARGETS settings used by the Modbus
+readers.  The settings are parsed once, when the reader is created, into
+ModbusDevice and ModbusSensor objects that hold everything needed to read and
+decode each sensor, including the compiled 'transform' expression.
+
+See the documentation of these settings in the system_files/settings_template.py
+file.
+"""
+import logging
+import struct
+
+from . import base_reader
+
+# Number of registers and the struct unpacking code for each data type.
+DATATYPES = {
+    'uint16': (1, 'H'),
+    'int16': (1, 'h'),
+    'uint32': (2, 'I'),
+    'int32': (2, 'i'),
+    'float': (2, 'f'),
+    'float32': (2, 'f'),
+    'double': (4, 'd'),
+    'float64': (4, 'd'),
+}
+
+# struct code used to pack the unsigned integer formed from the registers,
+# keyed on the number of registers.
+PACK_FORMATS = {
+    1: 'H',
+    2: 'I',
+    4: 'Q'
+}
+
+# Name of the pymodbus client method used to read each register type.
+REGISTER_TYPES = {
+    'holding': 'read_holding_registers',
+    'input': 'read_input_registers',
+    'coil': 'read_coils',
+    'discrete': 'read_discrete_inputs',
+}
+
+READING_TYPES = {
+    'value': base_reader.VALUE,
+    'state': base_reader.STATE,
+    'counter': base_reader.COUNTER
+}
+
+class ModbusSensor:
+    """One sensor from the list of sensors of a Modbus device.
+    """
+
+    def __init__(self, sensor_info):
+        """'sensor_info' is the (register, sensor_name) or (register, sensor_name,
+        options) tuple from the settings.  Raises ValueError if the options are
+        invalid.
+        """
+        try:
+            self.register, self.sensor_name, kwargs = sensor_info
+        except:
+            self.register, self.sensor_name = sensor_info
+            kwargs = {}
+        self.info = sensor_info
+
+        datatype = kwargs.get('datatype', 'uint16')
+        if datatype not in DATATYPES:
+            raise ValueError(f'Invalid Modbus Datatype: {datatype} for Sensor {sensor_info}')
+        self.datatype = datatype
+        self.reg_count, self.unpack_fmt = DATATYPES[datatype]
+        self.pack_fmt = PACK_FORMATS[self.reg_count]
+
+        self.register_type = kwargs.get('register_type', 'holding')
+        if self.register_type not in REGISTER_TYPES:
+            raise ValueError(f'Invalid Modbus register type for Sensor {sensor_info}')
+        self.read_method = REGISTER_TYPES[self.register_type]
+
+        reading_type = kwargs.get('reading_type', 'value')
+        if reading_type not in READING_TYPES:
+            raise ValueError(f'Invalid Reading Type for Sensor {sensor_info}')
+        self.reading_type = reading_type
+        self.reading_type_code = READING_TYPES[reading_type]
+
+        # the 'transform' expression, which uses the variable 'val', compiled
+        # so it is not parsed on every read.
+        transform = kwargs.get('transform', None)
+        try:
+            self.transform = compile(transform, f'<transform {self.sensor_name}>', 'eval') if transform else None
+        except SyntaxError as err:
+            raise ValueError(f'Invalid transform for Sensor {sensor_info}: {err}')
+
+    def decode(self, registers, endian):
+        """Returns the sensor value from the list of 'registers' read from the
+        device, most-significant register first if 'endian' is 'big'.
+        """
+        # make an array of register values with least-signifcant value first
+        if endian == 'big':
+            registers = reversed(registers)
+
+        # calculate the integer equivalent of the registers read
+        val = 0
+        mult = 1
+        for reg in registers:
+            val += reg * mult
+            mult *= 2**16
+
+        # Use the struct module to convert this number into the appropriate data type.
+        # First, create a byte array that encodes this unsigned number according to
+        # how many words it contains, then unpack to the correct datatype.
+        val = struct.unpack(self.unpack_fmt, struct.pack(self.pack_fmt, val))[0]
+
+        if self.transform:
+            val = eval(self.transform, {}, {'val': val})
+        return val
+
+    def rollover(self):
+        """Returns the size of the range of transformed values of a counter with
+        this sensor's unsigned integer data type, which is the amount the
+        transformed value drops by when the counter wraps to zero.  Returns
+        None if the sensor is not an unsigned integer counter.
+        """
+        bits = {'uint16': 16, 'uint32': 32}.get(self.datatype)
+        if self.reading_type != 'counter' or bits is None:
+            return None
+        if self.transform:
+            # the transform may offset the value as well as scale it
+            return eval(self.transform, {}, {'val': 2 ** bits}) - eval(self.transform, {}, {'val': 0})
+        return 2 ** bits
+
+
+class ModbusDevice:
+    """One device from the list of Modbus targets, with its sensors.
+    """
+
+    def __init__(self, device_info, sensors, rtu=False):
+        """'device_info' and 'sensors' are one entry of the MODBUS_TARGETS setting,
+        or of the MODBUS_RTU_TARGETS setting if 'rtu' is True.  Sensors with
+        invalid options are logged and skipped.  Raises ValueError if the
+        device options are invalid.
+        """
+        self.info = device_info
+        try:
+            addr1, addr2, kwargs = device_info
+        except:
+            addr1, addr2 = device_info
+            kwargs = {}
+        if rtu:
+            self.serial_port, self.device_addr = addr1, addr2
+            self.timeout = kwargs.get('timeout', 1.0)
+            self.baudrate = kwargs.get('baudrate', 9600)
+            self.name = f'{self.serial_port}/{self.device_addr}'
+        else:
+            self.host, self.port = addr1, addr2
+            self.device_addr = kwargs.get('device_addr', 1)
+            self.name = f'{self.host}:{self.port}/{self.device_addr}'
+        self.endian = kwargs.get('endian', 'big')
+        if self.endian not in ('big', 'little'):
+            raise ValueError(f'Improper endian value for Modbus device {device_info}')
+        self.read_interval = kwargs.get('read_interval')
+        self.read_offset = kwargs.get('read_offset')
+
+        self.sensors = []
+        for sensor_info in sensors:
+            try:
+                self.sensors.append(ModbusSensor(sensor_info))
+            except:
+                logging.exception(f'Skipping invalid sensor on Modbus Device {device_info}')
+
+
+def parse_targets(targets):
+    """Parses the MODBUS_TARGETS setting into a list of ModbusDevice objects.
+    """
+    return [ModbusDevice(device_info, sensors) for device_info, sensors in targets]
+
+def parse_rtu_targets(targets):
+    """Parses the MODBUS_RTU_TARGETS setting into a list of ModbusDevice objects.
+    """
+    return [ModbusDevice(device_info, sensors, rtu=True) for device_info, sensors in targets]
@@ -11,129 +11,119 @@ Note: Each Modbus "sensor" will generate one Modbus read, so consider this when
 READ_INTERVAL setting in the settings file.
 """
 import time
-import struct
 import logging
+import functools
+import numpy as np
 from pymodbus.client.sync import ModbusTcpClient as ModbusClient
 
 from . import base_reader
+from . import modbus_config
+from . import reading_batch
 
 class ModbusTCPreader(base_reader.Reader):
-    
-    def read(self):
-
-        # list to hold final readings
-        readings = []
-
-        for device_info, sensors in self._settings.MODBUS_TARGETS:
-
-            # use the same timestamp for all of the sensors on this device
-            ts = time.time()
-            try:
-                try:
-                    host, port, kwargs = device_info
-                except:
-                    host, port = device_info
-                    kwargs = {}
-                device_addr = kwargs.get('device_addr', 1)
-                endian = kwargs.get('endian', 'big')
-
-                if endian not in ('big', 'little'):
-                    raise ValueError(f'Improper endian value for Modbus device {device_info}') 
-
-                with ModbusClient(host=host, port=port) as client:
-                    for sensor_info in sensors:
-                        try:
-                            try:
-                                register, sensor_name, kwargs = sensor_info
-                            except:
-                                register, sensor_name = sensor_info
-                                kwargs = {}
-                            
-                            datatype = kwargs.get('datatype', 'uint16')
-                            transform = kwargs.get('transform', None)
-                            register_type = kwargs.get('register_type', 'holding')
-                            reading_type = kwargs.get('reading_type', 'value')
-
-                            # determine number of registers to read and the correct struct
-                            # unpacking code based upon the data type for this sensor.
-                            try:
-                                reg_count, unpack_fmt = {
-                                    'uint16': (1, 'H'),
-                                    'int16': (1, 'h'),
-                                    'uint32': (2, 'I'),
-                                    'int32': (2, 'i'),
-                                    'float': (2, 'f'),
-                                    'float32': (2, 'f'),
-                                    'double': (4, 'd'),
-                                    'float64': (4, 'd'),
-                                }[datatype]
-                            except:
-                                logging.exception(f'Invalid Modbus Datatype: {datatype} for Sensor {sensor_info}')
-                                continue
-
-                            # Determine the correct function to use for reading the values
-                            try:
-                                read_func = {
-                                    'holding': client.read_holding_registers,
-                                    'input': client.read_input_registers,
-                                    'coil': client.read_coils,
-                                    'discrete': client.read_discrete_inputs
-                                    }[register_type]
-                            except:
-                                logging.exception(f'Invalid Modbus register type for Sensor {sensor_info}')
-                                continue
-
-                            try:
-                                reading_type_code = {
-                                    'value': base_reader.VALUE,
-                                    'state': base_reader.STATE,
-                                    'counter': base_reader.COUNTER
-                                }[reading_type]
-                            except:
-                                logging.exception(f'Invalid Reading Type for Sensor {sensor_info}')
-                                continue
-
-
-                            result = read_func(register, reg_count, unit=device_addr)
-                            if not hasattr(result, 'registers'):
-                                raise ValueError(f'An error occurred while reading Sensor {sensor_info} from Modbus Device {device_info}')
-                            
-                            # make an array of register values with least-signifcant value first
-                            registers = result.registers
-
-                            # calculate the integer equivalent of the registers read
-                            if endian == 'big':
-                                registers = reversed(registers)
-                            val = 0
-                            mult = 1
-                            for reg in registers:
-                                val += reg * mult
-                                mult *= 2**16
-
-                            # Use the struct module to convert this number into the appropriate data type.
-                            # First, create a byte array that encodes this unsigned number according to 
-                            # how many words it contains.
-                            reg_count_to_pack_fmt = {
-                                1: 'H',
-                                2: 'I',
-                                4: 'Q'
-                            }
-                            pack_fmt = reg_count_to_pack_fmt[reg_count]
-                            packed_bytes = struct.pack(pack_fmt, val)
-                            # unpack bytes to convert to correct datatype
-                            val = struct.unpack(unpack_fmt, packed_bytes)[0]
-
-                            if transform:
-                                val = eval(transform)
-                            sensor_id = f'{self._settings.LOGGER_ID}_{sensor_name}'
-                            readings.append( (ts, sensor_id, val, reading_type_code) )                                
-
-                        except Exception as err:
+
+    # Readings are gathered into arrays by read_device()
+    supports_batch = True
+
+    settings_schema = {
+        'MODBUS_TARGETS': (modbus_config.parse_targets, base_reader.REQUIRED),
+    }
+
+    def __init__(self, settings=None, config=None):
+        """'settings' is the general settings file for the application.  'config'
+        is passed to the base class; see base_reader.Reader.
+        """
+        super().__init__(settings, config)
+
+        # index of each sensor in the sensor table, keyed on ModbusSensor
+        self.sensor_indices = {}
+        for device in self.config['MODBUS_TARGETS']:
+            for sensor in device.sensors:
+                sensor_id = f'{self._settings.LOGGER_ID}_{sensor.sensor_name}'
+                self.sensor_indices[sensor] = self.sensor_table.index(sensor_id, sensor.reading_type_code)
+
+    def read_batch(self):
+        """Returns the readings from all of the Modbus devices as one
+        ReadingBatch.
+        """
+        batches = [self.read_device(device) for device in self.config['MODBUS_TARGETS']]
+        return reading_batch.ReadingBatch.concatenate(batches, self.sensor_table)
+
+    def read_groups(self):
+        """Returns one read group for each Modbus device, so that each device can
+        have its own read interval and offset.  These are given by the
+        'read_interval' and 'read_offset' keys of the optional device dictionary.
+        """
+        groups = []
+        for device in self.config['MODBUS_TARGETS']:
+            groups.append( (
+                device.name,
+                functools.partial(self.read_device, device, raise_errors=True),
+                device.read_interval,
+                device.read_offset,
+            ) )
+        return groups
+
+    def counter_rollovers(self):
+        """Returns the rollover values of the unsigned integer counter sensors,
+        from their datatype and transform.  Keys are Sensor IDs.
+        """
+        rollovers = {}
+        for device in self.config['MODBUS_TARGETS']:
+            for sensor in device.sensors:
+                val = sensor.rollover()
+                if val is not None:
+                    rollovers[f'{self._settings.LOGGER_ID}_{sensor.sensor_name}'] = val
+        return rollovers
+
+    def read_device(self, device, raise_errors=False):
+        """Reads the sensors of 'device', a modbus_config.ModbusDevice from the
+        parsed MODBUS_TARGETS setting.  Returns a ReadingBatch of the readings.
+        If 'raise_errors' is True, an error reaching the device, or failure of
+        all of its sensors, raises an exception instead of being logged, so the
+        caller can track failures of the device.
+        """
+
+        # sensor indices and values of the readings, filled in as the sensors
+        # are read.  'count' is the number of readings.
+        indices = np.empty(len(device.sensors), dtype=np.int32)
+        values = np.empty(len(device.sensors), dtype=np.float64)
+        count = 0
+
+        # errors reading individual sensors, if they are not logged
+        sensor_errors = []
+
+        # use the same timestamp for all of the sensors on this device
+        ts = time.time()
+        try:
+            with ModbusClient(host=device.host, port=device.port) as client:
+                for sensor in device.sensors:
+                    try:
+                        read_func = getattr(client, sensor.read_method)
+                        result = read_func(sensor.register, sensor.reg_count, unit=device.device_addr)
+                        if not hasattr(result, 'registers'):
+                            raise ValueError(f'An error occurred while reading Sensor {sensor.info} from Modbus Device {device.info}')
+
+                        values[count] = sensor.decode(result.registers, device.endian)
+                        indices[count] = self.sensor_indices[sensor]
+                        count += 1
+
+                    except Exception as err:
+                        if raise_errors:
+                            sensor_errors.append(err)
+                        else:
                             logging.exception(str(err))
-                            continue    # on to next sensor
+                        continue    # on to next sensor
+
+        except Exception as err:
+            if raise_errors:
+                raise
+            logging.exception(str(err))
 
-            except Exception as err:
-                logging.exception(str(err))
-                continue   # on to next device
+        if sensor_errors:
+            if count == 0:
+                raise RuntimeError(f'All {len(sensor_errors)} sensors failed on Modbus Device {device.info}; last error: {sensor_errors[-1]}')
+            for err in sensor_errors:
+                logging.error(str(err))
 
-        return readings
+        return reading_batch.ReadingBatch(self.sensor_table, ts, indices[:count], values[:count])
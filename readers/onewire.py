@@ -52,11 +52,14 @@ def owserver_running():
 
 
 class OneWire(base_reader.Reader):
+    # This reader claims a port from 'available_ftdi_ports', so it is created
+    # one at a time with the other readers that do.
+    uses_ftdi_ports = True
     
-    def __init__(self, settings=None):
+    def __init__(self, settings=None, config=None):
         
         # Call constructor of base class
-        super(OneWire, self).__init__(settings)
+        super(OneWire, self).__init__(settings, config)
         
         # Tracks the port that the 1-wire interface is on
         self.known_port = ''
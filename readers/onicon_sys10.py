@@ -36,6 +36,24 @@ from . import modbus_rtu
 
 class OniconSystem10(modbus_rtu.ModbusRTUreader):
 
+    # The BTU readings from all registers must be combined, so read all devices
+    # together as one group instead of one group per device.
+    read_groups = base_reader.Reader.read_groups
+
+    # The combining is done on the list of readings from read(), so the logger
+    # should call read() instead of read_batch().
+    supports_batch = False
+
+    def counter_rollovers(self):
+        """Returns the rollover values of the Modbus counters, leaving out the
+        kBtu, MBtu and GBtu registers.  Those are combined into the floating
+        point MBtu readings, which do not roll over at the register size.
+        """
+        rollovers = super().counter_rollovers()
+        for name in ('kbtu', 'mbtu', 'gbtu'):
+            rollovers.pop(f'{self._settings.LOGGER_ID}_{name}', None)
+        return rollovers
+
     def read(self):
 
         readings = super().read()
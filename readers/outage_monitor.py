@@ -12,6 +12,10 @@ PIN_STATE = 16
 
 class OutageMonitor(base_reader.Reader):
 
+    @classmethod
+    def resources(cls, config):
+        return [('gpio', PIN_STATE, False)]
+
     def read(self):
 
         # Set up digital I/O pin that reads the state of the power.
@@ -0,0 +1,112 @@
+"""Columnar form of a set of sensor readings, returned by a Reader's
+read_batch() method as an alternative to the list of (ts, read_id, val,
+read_type) tuples returned by read().  Instead of four objects per reading, a
+batch holds three arrays: the timestamps (or one timestamp shared by all of
+the readings), the indices of the sensors in a SensorTable, and the float64
+values.  Readers that produce arrays of values, e.g. Modbus block reads or
+sampled analog channels, can return them without building tuples, and the
+logger controller adds each sensor's readings to its accumulator as arrays.
+"""
+import itertools
+import numpy as np
+
+class SensorTable:
+    """Interns the Sensor IDs and reading types of a reader's sensors, so that
+    a batch refers to each sensor by a small integer index.  A reader keeps one
+    table for all of its batches.
+    """
+
+    def __init__(self):
+        self.ids = []      # Sensor ID, by index
+        self.types = []    # reading type, by index
+        self._index = {}   # index, keyed on (Sensor ID, reading type)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def index(self, sensor_id, read_type):
+        """Returns the index of the sensor 'sensor_id' with the reading type
+        'read_type', adding it to the table if needed.
+        """
+        key = (sensor_id, read_type)
+        ix = self._index.get(key)
+        if ix is None:
+            ix = len(self.ids)
+            self.ids.append(sensor_id)
+            self.types.append(read_type)
+            self._index[key] = ix
+        return ix
+
+
+class ReadingBatch:
+    """A set of readings from one read of a reader.
+    """
+
+    def __init__(self, table, ts, indices, values):
+        """'table' is the SensorTable the sensor 'indices' refer to.  'ts' is one
+        Unix timestamp shared by all of the readings, or a sequence with a
+        timestamp for each reading.  'indices' and 'values' are sequences with
+        the sensor index and the value of each reading.
+        """
+        self.table = table
+        self.indices = np.asarray(indices, dtype=np.int32)
+        self.values = np.asarray(values, dtype=np.float64)
+        if np.ndim(ts) == 0:
+            self.ts = float(ts)
+        else:
+            self.ts = np.asarray(ts, dtype=np.float64)
+            if len(self.ts) != len(self.indices):
+                raise ValueError('A ReadingBatch needs one timestamp or one per reading.')
+        if len(self.values) != len(self.indices):
+            raise ValueError('A ReadingBatch needs one value per sensor index.')
+
+    def __len__(self):
+        return len(self.indices)
+
+    @classmethod
+    def from_readings(cls, readings, table):
+        """Returns a ReadingBatch holding 'readings', a list of (ts, read_id,
+        val, read_type) tuples as returned by a Reader's read() method, adding
+        the sensors to 'table' as needed.  Used to adapt readers that only
+        provide read().
+        """
+        ts = [reading[0] for reading in readings]
+        indices = [table.index(read_id, read_type) for _, read_id, _, read_type in readings]
+        values = [reading[2] for reading in readings]
+        return cls(table, ts, indices, values)
+
+    @classmethod
+    def concatenate(cls, batches, table):
+        """Returns one ReadingBatch holding the readings of all of the
+        'batches', which must all use the SensorTable 'table'.
+        """
+        if len(batches) == 0:
+            return cls(table, [], [], [])
+        return cls(
+            table,
+            np.concatenate([batch.timestamps() for batch in batches]),
+            np.concatenate([batch.indices for batch in batches]),
+            np.concatenate([batch.values for batch in batches]),
+        )
+
+    def timestamps(self):
+        """Returns an array with the timestamp of each reading.
+        """
+        if isinstance(self.ts, float):
+            return np.full(len(self.indices), self.ts)
+        return self.ts
+
+    def columns(self):
+        """Returns an iterator of (ts, sensor index, value) for the readings,
+        with Python numbers instead of NumPy scalars.
+        """
+        ts = itertools.repeat(self.ts) if isinstance(self.ts, float) else self.ts.tolist()
+        return zip(ts, self.indices.tolist(), self.values.tolist())
+
+    def readings(self):
+        """Returns the readings as a list of (ts, read_id, val, read_type)
+        tuples, the form returned by a Reader's read() method.
+        """
+        ids = self.table.ids
+        types = self.table.types
+        return [(ts, ids[ix], val, types[ix]) for ts, ix, val in self.columns()]
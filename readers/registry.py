@@ -0,0 +1,89 @@
+"""Loads the reader classes listed in the READERS setting and checks their
+configuration before any reader is created.  For each reader, the settings
+declared in its 'settings_schema' are parsed and validated, and the hardware
+resources it uses (serial ports, I2C addresses, GPIO pins) are determined, so
+that two readers claiming the same resource are detected at startup.
+"""
+import logging
+import os
+
+class RegisteredReader:
+    """A reader class from the READERS setting whose configuration is valid.
+    """
+
+    def __init__(self, name, klass, config, resources):
+        """'name' is the reader name from the READERS setting, e.g.
+        'sys_info.SysInfo', and 'klass' is the reader class.  'config' is the
+        result of the class's parse_settings() and 'resources' is the list of
+        resources returned by its resources() method.
+        """
+        self.name = name
+        self.klass = klass
+        self.config = config
+        self.resources = resources
+        self.capabilities = klass.capabilities()
+
+    def describe(self):
+        """Returns a one line description of the reader for the log.
+        """
+        desc = self.name
+        if self.resources:
+            desc += ', resources: %s' % ', '.join('%s %s' % (kind, res_name) for kind, res_name, shared in self.resources)
+        if self.capabilities:
+            desc += ', supports: %s' % ', '.join(self.capabilities)
+        return desc
+
+
+def load_class(reader_name):
+    """Imports the module containing the reader class named 'reader_name' from
+    the READERS setting, e.g. 'sys_info.SysInfo', and returns the class.
+    """
+    parts = ('readers.' + reader_name).split('.')
+    mod = __import__('.'.join(parts[:-1]), fromlist=[parts[-1]])
+    return getattr(mod, parts[-1])
+
+def resource_key(kind, res_name):
+    """Returns a key identifying a resource, with serial port names resolved
+    so that different paths to the same device compare equal.
+    """
+    if kind == 'serial':
+        res_name = os.path.realpath(res_name)
+    return (kind, str(res_name).lower())
+
+def register(reader_classes, settings):
+    """Checks the configuration of each reader in 'reader_classes', a list of
+    (reader_name, klass) tuples in the order they should be created.  Returns a
+    list of RegisteredReader objects for the readers whose settings are valid
+    and whose resources do not conflict with a reader earlier in the list.
+    Problems with the other readers are logged.
+    """
+    registered = []
+
+    # reader claiming each resource, keyed on resource_key(), with values of
+    # (reader name, shared).
+    claims = {}
+
+    for reader_name, klass in reader_classes:
+        try:
+            config = klass.parse_settings(settings)
+            resources = list(klass.resources(config))
+        except:
+            logging.exception('Invalid configuration for %s reader; it will not be started.' % reader_name)
+            continue
+
+        conflicts = []
+        for kind, res_name, shared in resources:
+            claim = claims.get(resource_key(kind, res_name))
+            if claim and claim[0] != reader_name and not (shared and claim[1]):
+                conflicts.append('%s %s is also used by %s' % (kind, res_name, claim[0]))
+        if conflicts:
+            logging.error('Resource conflict for %s reader; it will not be started: %s' % (reader_name, '; '.join(conflicts)))
+            continue
+
+        for kind, res_name, shared in resources:
+            claims.setdefault(resource_key(kind, res_name), (reader_name, shared))
+        info = RegisteredReader(reader_name, klass, config, resources)
+        registered.append(info)
+        logging.debug('Registered reader %s' % info.describe())
+
+    return registered
@@ -27,6 +27,7 @@ for the 6 channel RMS board.
 
 import time
 from . import base_reader
+from . import reading_batch
 import board
 import busio
 import adafruit_ads1x15.ads1015 as ADS
@@ -37,49 +38,60 @@ import numpy as np
 SAMPLES = 500  # samples per channel to calculate RMS
 RATE = 3300    # samples/second, fastest rate available
 
+def channel_values(setting_val, convert):
+    """Returns a list of 6 channel values from 'setting_val', which is a list of
+    6 values or one value for all channels.  Each value is converted with the
+    'convert' function.
+    """
+    try:
+        vals = [convert(val) for val in setting_val]
+    except TypeError:
+        # Must have been a scalar instead of a list or tuple
+        vals = [convert(setting_val)] * 6
+    if len(vals) != 6:
+        raise ValueError('Must be one value or a list of 6 values.')
+    return vals
+
 class RMS_6ch(base_reader.Reader):
-    
-    def __init__(self,  settings=None):
-        """'settings' is the general settings file for the application.
+
+    # the six channel values are computed as an array
+    supports_batch = True
+
+    # Channel gain and multipliers, defaulting to a gain of 1 and multiplier
+    # of 1.0 if not in the settings file.
+    settings_schema = {
+        'RMS_6CH_GAIN': (lambda val: channel_values(val, lambda x: x), [1] * 6),
+        'RMS_6CH_MULT': (lambda val: channel_values(val, float), [1.0] * 6),
+    }
+
+    @classmethod
+    def resources(cls, config):
+        """The I2C addresses of the two ADS1015 converters.
+        """
+        return [('i2c', '0x48', False), ('i2c', '0x49', False)]
+
+    def __init__(self, settings=None, config=None):
+        """'settings' is the general settings file for the application.  'config'
+        is passed to the base class; see base_reader.Reader.
         """
         # Call constructor of base class
-        super(RMS_6ch, self).__init__(settings)
-        
-        # Get channel gain and multipliers from the settings file if they
-        # are present.
-        if hasattr(settings, 'RMS_6CH_GAIN'):
-            try:
-                self._gain = list(settings.RMS_6CH_GAIN)
-            except:
-                # Must have been a scalar instead of a list or tuple
-                self._gain = [settings.RMS_6CH_GAIN] * 6
-        else:
-            # Nothing the settings file, so default to gain of 1
-            self._gain = [1] * 6
-            
-        if hasattr(settings, 'RMS_6CH_MULT'):
-            try:
-                self._mult = list(settings.RMS_6CH_MULT)
-            except:
-                # must have been a scalar instead of a list or tuple
-                self._mult = [float(settings.RMS_6CH_MULT)] * 6
-        else:
-            self._mult = [1.0] * 6
+        super(RMS_6ch, self).__init__(settings, config)
         
-    def read(self):
+        self._gain = self.config['RMS_6CH_GAIN']
+        self._mult = np.array(self.config['RMS_6CH_MULT'])
 
-        
-        # Channels to cycle through and read, along with channel number identifier
-        channels = [
-            (ADS.P0, 0),
-            (ADS.P1, 1),
-            (ADS.P2, 2)
+        # the six channels, in order, in the sensor table
+        self._indices = [
+            self.sensor_table.index(f'{self._settings.LOGGER_ID}_rms_ch{ix + 1}', base_reader.VALUE)
+            for ix in range(6)
         ]
+        
+    def read_batch(self):
 
         # use the same timestamp for all six channels
         ts = time.time()
         data = [None] * SAMPLES
-        readings = []
+        rms_vals = np.zeros(6)
 
         # Create the I2C bus
         i2c = busio.I2C(board.SCL, board.SDA)
@@ -93,8 +105,6 @@ class RMS_6ch(base_reader.Reader):
             ads.data_rate = RATE
             
             for ads_ch in (ADS.P0, ADS.P1, ADS.P2):
-                
-                sensor_id = f'{self._settings.LOGGER_ID}_rms_ch{ix + 1}'
 
                 ads.gain = self._gain[ix]
                 # Create differential input between this channel and channel 3.
@@ -104,12 +114,7 @@ class RMS_6ch(base_reader.Reader):
                     data[i] = chan.voltage
                 arr = np.array(data)
                 arr2 = arr * arr
-                rms = arr2.mean() ** 0.5
-                readings.append((ts, 
-                                 sensor_id, 
-                                 rms * self._mult[ix], 
-                                 base_reader.VALUE)
-                               )
+                rms_vals[ix] = arr2.mean() ** 0.5
                 ix += 1
 
-        return readings
+        return reading_batch.ReadingBatch(self.sensor_table, ts, self._indices, rms_vals * self._mult)
@@ -24,6 +24,10 @@ minimalmodbus.TIMEOUT = 2.0
 class Sage21Reader(base_reader.Reader):
     """Class to read sensor and status values from a Sage 2.1 Boiler Controller.
     """
+
+    # This reader claims a port from 'available_ftdi_ports', so it is created
+    # one at a time with the other readers that do.
+    uses_ftdi_ports = True
     
     def add_reading(self, rd_name, rd_val, rd_type=base_reader.VALUE):
         """Adds a reading to the self.readings list of readings.  Add the 
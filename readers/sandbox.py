@@ -0,0 +1,205 @@
+"""Runs a sensor reader in a child process, so that a reader that hangs
+inside a serial, I2C or network call cannot block the logger.  Each read is
+requested over a pipe and must complete within a deadline; if it does not,
+the child process is killed and a new one is started in the background.
+Reads made while the new child process is starting fail, so the logger's
+retry backoff applies to them.
+
+The read groups and counter rollovers of the sandboxed reader are determined
+in the child process and made available by the SandboxReader.  Batched reads
+are not passed through: readings returned by read_batch() in the child are
+sent back to the logger as a list of tuples.
+
+Readers are sandboxed by listing them in the SANDBOX_READERS setting.
+"""
+import logging
+import multiprocessing
+import threading
+import traceback
+from functools import partial
+
+from . import base_reader
+from . import reading_batch
+
+# Processes are forked so that the settings module and reader class do not
+# need to be pickled to start the child.
+mp_context = multiprocessing.get_context('fork')
+
+def child_main(conn, reader_class, settings, config, ftdi_ports):
+    """Runs in the child process.  Creates the reader from 'settings' and
+    'config' (see base_reader.Reader) and then reads it each time a request is
+    received on the 'conn' pipe, sending back the readings.  A request is None
+    to read the whole reader, or the index of one of the reader's read groups.
+    'ftdi_ports' is the list of FTDI ports the reader may claim.
+    """
+    base_reader.Reader.available_ftdi_ports = ftdi_ports
+    try:
+        reader = reader_class(settings, config=config)
+        groups = reader.read_groups()
+        info = {
+            # FTDI ports that remain unclaimed
+            'ports': base_reader.Reader.available_ftdi_ports,
+            'groups': [(group_name, interval, offset) for group_name, read_func, interval, offset in groups],
+            'rollovers': reader.counter_rollovers(),
+        }
+        conn.send(('started', info))
+    except:
+        conn.send(('error', traceback.format_exc()))
+        return
+
+    while True:
+        try:
+            group_ix = conn.recv()
+        except EOFError:
+            # parent has gone away
+            return
+        try:
+            result = reader.read() if group_ix is None else groups[group_ix][1]()
+            if isinstance(result, reading_batch.ReadingBatch):
+                result = result.readings()
+            conn.send(('ok', list(result)))
+        except:
+            conn.send(('error', traceback.format_exc()))
+
+
+class SandboxReader(base_reader.Reader):
+    """Reader that runs another reader class in a child process.
+    """
+
+    def __init__(self, reader_class, settings=None, deadline=None, start_deadline=60.0, config=None):
+        """'reader_class' is the Reader class to run in the child process, which
+        is constructed with 'settings' and 'config' (see base_reader.Reader).
+        'deadline' is the number of seconds a read can take before the child
+        process is killed; it defaults to the READ_INTERVAL setting.
+        'start_deadline' is the number of seconds allowed for the child process
+        to construct the reader.  The child process is started here so that
+        errors constructing the reader are raised from this constructor; later
+        restarts happen in a background thread.
+        """
+        super().__init__(settings)
+        self.reader_class = reader_class
+        # parsed settings for the reader class, or None to parse them in the child
+        self.reader_config = config
+        self.deadline = deadline if deadline else getattr(self._settings, 'READ_INTERVAL', 10)
+        self.start_deadline = start_deadline
+        self._proc = None
+        self._conn = None
+        # FTDI ports claimed by the reader in the child process
+        self._claimed_ports = []
+        # (group_name, interval, offset) of the reader's read groups, and its
+        # counter rollovers, as reported by the child process.
+        self._groups = []
+        self._rollovers = {}
+        # serializes requests on the pipe, as read groups can be read from
+        # several threads.
+        self._lock = threading.Lock()
+        # thread restarting the child process, if a restart is in progress
+        self._restart_thread = None
+        self._start()
+
+    def _start(self):
+        """Starts the child process and waits for it to construct the reader.
+        """
+        parent_conn, child_conn = mp_context.Pipe()
+        ports = base_reader.Reader.available_ftdi_ports
+        self._proc = mp_context.Process(
+            target=child_main,
+            args=(child_conn, self.reader_class, self._settings, self.reader_config, ports + self._claimed_ports),
+            daemon=True,
+        )
+        self._proc.start()
+        child_conn.close()
+        self._conn = parent_conn
+
+        status, result = self._receive(self.start_deadline)
+        if status != 'started':
+            self._stop()
+            raise RuntimeError('Error starting %s in child process:\n%s' % (self.reader_class.__name__, result))
+
+        # Remove the ports claimed by the child from the ports available to
+        # other readers, remembering them so a restarted child can claim them.
+        for port in ports + self._claimed_ports:
+            if port not in result['ports'] and port not in self._claimed_ports:
+                self._claimed_ports.append(port)
+        ports[:] = [port for port in ports if port not in self._claimed_ports]
+        self._groups = result['groups']
+        self._rollovers = result['rollovers']
+
+    def _restart(self):
+        """Starts a new child process, logging any error.  Runs in the restart
+        thread; no requests are sent to the child while this thread is alive.
+        """
+        try:
+            self._stop()
+            self._start()
+            logging.info('Restarted child process for %s' % self.reader_class.__name__)
+        except:
+            logging.exception('Error restarting child process for %s' % self.reader_class.__name__)
+
+    def _stop(self):
+        """Kills the child process.
+        """
+        if self._proc is not None:
+            self._proc.terminate()
+            self._proc.join(1.0)
+            if self._proc.is_alive():
+                self._proc.kill()
+                self._proc.join()
+            self._proc = None
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _receive(self, deadline):
+        """Returns the next (status, result) message from the child process,
+        waiting up to 'deadline' seconds.  If the deadline is exceeded or the
+        child process has exited, the child process is killed and a
+        RuntimeError is raised.
+        """
+        try:
+            if self._conn.poll(deadline):
+                return self._conn.recv()
+            msg = 'exceeded its %s second deadline' % deadline
+        except EOFError:
+            msg = 'exited unexpectedly'
+        self._stop()
+        raise RuntimeError('Child process for %s %s and was stopped.' % (self.reader_class.__name__, msg))
+
+    def _request(self, group_ix):
+        """Requests readings of the read group with index 'group_ix', or of
+        the whole reader if None, from the child process.  If the child process
+        is not running, a restart is started in the background and a
+        RuntimeError is raised; reads fail until the restart completes.
+        """
+        with self._lock:
+            if self._restart_thread is not None and self._restart_thread.is_alive():
+                raise RuntimeError('Child process for %s is restarting.' % self.reader_class.__name__)
+            if self._proc is None or not self._proc.is_alive():
+                logging.warning('Restarting child process for %s' % self.reader_class.__name__)
+                self._restart_thread = threading.Thread(target=self._restart, daemon=True)
+                self._restart_thread.start()
+                raise RuntimeError('Child process for %s is not running and is being restarted.' % self.reader_class.__name__)
+            self._conn.send(group_ix)
+            status, result = self._receive(self.deadline)
+        if status != 'ok':
+            raise RuntimeError('Error reading %s in child process:\n%s' % (self.reader_class.__name__, result))
+        return result
+
+    def read(self):
+        """Requests readings from the reader in the child process.
+        """
+        return self._request(None)
+
+    def read_groups(self):
+        """Returns the read groups of the reader in the child process, each
+        read by requesting the group's readings from the child.
+        """
+        return [
+            (group_name, partial(self._request, ix), interval, offset)
+            for ix, (group_name, interval, offset) in enumerate(self._groups)
+        ]
+
+    def counter_rollovers(self):
+        """Returns the counter rollovers of the reader in the child process.
+        """
+        return self._rollovers
@@ -17,6 +17,10 @@ class SensaphoneReader(base_reader.Reader):
     # The highest valid node
     NODE_MAX = 32
 
+    settings_schema = {
+        'SENSAPHONE_HOST_IP': (str, base_reader.REQUIRED),
+    }
+
     def get_value_list(self, oid):
         '''Reuturns a list of values at the object id, 'oid'.  If an error occurs
         an empty list is returned.
@@ -105,9 +109,9 @@ class SensaphoneReader(base_reader.Reader):
 
         readings = []
 
-        # pull the HOST IP address from the settings file and store as an object
+        # the HOST IP address from the settings file, stored as an object
         # variable.
-        self.host_ip = self._settings.SENSAPHONE_HOST_IP
+        self.host_ip = self.config['SENSAPHONE_HOST_IP']
 
         # Note: the range starts at 2 because there is nothing at zero, and 1 is the number for the Host unit, which
         # only has sensors for the battery and sound.
@@ -6,10 +6,10 @@ from . import base_reader
 
 class TestCounterState(base_reader.Reader):
     
-    def __init__(self, settings=None):
+    def __init__(self, settings=None, config=None):
         
         # Call constructor of base class
-        super(TestCounterState, self).__init__(settings)
+        super(TestCounterState, self).__init__(settings, config)
         
         self.state = 0
         self.count = 0
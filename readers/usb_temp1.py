@@ -19,11 +19,16 @@ SERIAL_PORT = '/dev/ttyUSB0'
 
 class USBtemperature1(base_reader.Reader):
 
-    def __init__(self, settings=None):
-        """'settings' is the general settings file for the application.
+    @classmethod
+    def resources(cls, config):
+        return [('serial', SERIAL_PORT, False)]
+
+    def __init__(self, settings=None, config=None):
+        """'settings' is the general settings file for the application.  'config'
+        is passed to the base class; see base_reader.Reader.
         """
         # Call constructor of base class
-        super(USBtemperature1, self).__init__(settings)
+        super(USBtemperature1, self).__init__(settings, config)
 
         # Run the intialization for the DigiTemp program, which finds the sensors
         # and writes a configuration file .digitemprc in the current directory.
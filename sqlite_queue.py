@@ -104,6 +104,13 @@ class SqliteReliableQueue(object):
             conn.execute(self._append, (obj_pkl,))
             # the 'with' statement commits the insert.
 
+    def extend(self, objs):
+        """Adds each of the items in 'objs' to the queue, in one transaction.
+        """
+        objs_pkl = [(dumps(obj, 2),) for obj in objs]
+        with self._get_conn() as conn:
+            conn.executemany(self._append, objs_pkl)
+
     def popleft(self, sleep_wait=True):
         keep_pooling = True
         wait = 0.5       # initial wait time for new queue items
@@ -10,6 +10,182 @@ LOGGER_ID = 'test'
 READ_INTERVAL = 5   # seconds between readings
 LOG_INTERVAL = 10*60  # seconds between logging data
 
+# Individual readers can be read at an interval different from READ_INTERVAL.
+# Keys are the names used in the READERS setting below; values are the read
+# interval in seconds, or a tuple of (interval, offset), where offset is the
+# number of seconds after each interval boundary on the clock that the read
+# occurs.  For example:
+#   READER_INTERVALS = {
+#       'room_energy.RoomEnergyReader': 30,
+#       'sage_boiler.Sage21Reader': (60, 15),   # read at 15 seconds past each minute
+#   }
+# Modbus devices can also have their own intervals; see the 'read_interval'
+# and 'read_offset' keys in the MODBUS_TARGETS documentation.
+READER_INTERVALS = {}
+
+# Set to True to run the sensor readers concurrently instead of one after
+# another.  A slow reader then does not delay the other readers.  Each reader's
+# read can run for READER_TIMEOUT seconds (defaults to READ_INTERVAL) before
+# it is considered timed out; a reader whose read is still running is skipped
+# on following read cycles until the read completes.  The timeout can be set
+# for individual readers in READER_TIMEOUTS, keyed on the names used in the
+# READERS setting below, e.g. {'dg700.DG700reader': 4.0}.
+CONCURRENT_READERS = False
+READER_TIMEOUT = None       # seconds, None uses READ_INTERVAL
+READER_TIMEOUTS = {}
+
+# When a reader (or one Modbus device) fails on consecutive reads, it is
+# retried at doubling intervals, up to READ_BACKOFF_MAX seconds between
+# retries, until a read succeeds.  Set to 0 to retry on every read.
+READ_BACKOFF_MAX = 600     # seconds
+
+# Set to True to also publish the raw readings from each read cycle to the
+# "readings/raw/<reader>" MQTT topics, for use by local programs such as
+# the Current Reading Server (see below).  A sensor's raw reading is published
+# if at least RAW_PUBLISH_MIN_INTERVAL seconds have passed since its last
+# published reading *and* the value has changed by at least
+# RAW_PUBLISH_DEADBAND, or if RAW_PUBLISH_MAX_INTERVAL seconds have passed.
+RAW_PUBLISH = False
+RAW_PUBLISH_MIN_INTERVAL = 10.0    # seconds
+RAW_PUBLISH_DEADBAND = 0.0
+RAW_PUBLISH_MAX_INTERVAL = 300.0   # seconds
+
+# The above limits can be changed for individual sensors.  Keys are Sensor IDs
+# or wildcard patterns like '*_temp'; values are dictionaries with any of the
+# keys min_interval, deadband, max_interval.  For example:
+#   RAW_PUBLISH_SENSORS = {
+#       'test_pwr': dict(min_interval=2.0, deadband=5.0),
+#       '*_temp': dict(deadband=0.2),
+#   }
+RAW_PUBLISH_SENSORS = {}
+
+# Each logging interval, the readings of a value-type sensor are summarized
+# as their average.  Extra statistics for the interval can also be logged for
+# selected sensors, as separate sensors whose IDs have the statistic name as
+# a suffix, e.g. 'test_pwr_max'.  Keys are Sensor IDs or wildcard patterns;
+# values are lists of statistic names:
+#     'min', 'max':  minimum and maximum value
+#     'std':         standard deviation
+#     'twa':         time-weighted average
+#     'p' + number:  a percentile, e.g. 'p95' or 'p99.9'
+# For example:
+#   VALUE_STATS = {
+#       'test_pwr': ['max', 'p95'],
+#       '*_temp': ['min', 'max'],
+#   }
+VALUE_STATS = {}
+
+# Instead of the average, value-type sensors listed here are logged by
+# exception: each reading that differs from the last logged reading by at
+# least 'threshold' is logged (along with the reading just prior to it), as
+# is the first reading of each logging interval.  If 'threshold' is omitted,
+# it is 2% of the range of the readings in the interval.  If 'max_interval'
+# is given, a reading is also logged after that many reads without a
+# significant change.  Keys are Sensor IDs or wildcard patterns, e.g.:
+#   CHANGE_DETECT_SENSORS = {
+#       'test_pwr': dict(threshold=50.0, max_interval=60),
+#   }
+CHANGE_DETECT_SENSORS = {}
+
+# Counter-type sensors are logged as the last counter value in the logging
+# interval.  Counter sensors listed here also log the rate of change of the
+# counter over the interval, with '_rate' added to the Sensor ID.  The rate is
+# in counts per second times 'rate_mult' (default 1.0).  A drop in the counter
+# is treated as a rollover if the counter has a rollover value, and otherwise
+# as a reset to zero.  Modbus 'uint16' and 'uint32' counters have their
+# rollover value set from their datatype; for other counters it can be given
+# with the 'rollover' key.  Keys are Sensor IDs or wildcard patterns, e.g.:
+#   COUNTER_RATE_SENSORS = {
+#       'test_total_heat': dict(rate_mult=3600.0),     # per hour
+#       'test_pulses': dict(rollover=2**16, rate_mult=60.0),
+#   }
+COUNTER_RATE_SENSORS = {}
+
+# Value-type sensors listed here are logged with a time-weighted average
+# instead of the simple average of their readings, which is more accurate
+# when readings are irregularly spaced (e.g. some reads fail or time out).
+# Readings more than 'max_gap' seconds apart (default 3 * READ_INTERVAL) are
+# not averaged across.  The fraction of the logging interval covered by the
+# readings is also logged, with '_cov' added to the Sensor ID.  Keys are
+# Sensor IDs or wildcard patterns; values are dictionaries, e.g.:
+#   TIME_WEIGHTED_SENSORS = {
+#       'test_pwr': {},
+#       'test_flow': dict(max_gap=60.0),
+#   }
+TIME_WEIGHTED_SENSORS = {}
+
+# Virtual sensors are computed from the readings of other sensors and are
+# logged like other value sensors (including VALUE_STATS and
+# CHANGE_DETECT_SENSORS).  Keys are the Sensor IDs of the virtual sensors.
+# Each has these settings:
+#     'expr':    a Python expression using the aliases in 'inputs'.  NumPy is
+#                available as 'np', e.g. 'np.maximum(supply - ret, 0.0)'.
+#     'inputs':  a dictionary mapping the aliases used in 'expr' to the
+#                Sensor IDs of the source sensors.
+#     'mode':    'read' (default) computes the value on every read cycle from
+#                the latest source readings.  'interval' computes the values
+#                for all of the read cycles in the logging interval at once,
+#                using arrays of the source readings, which uses less CPU.
+#     'max_age': optional; the value is not computed if the source readings
+#                were taken more than this many seconds apart.
+#     'suppress_sources': optional; if True, the source sensors are not
+#                logged themselves, to reduce the amount of data posted.
+# For example:
+#   VIRTUAL_SENSORS = {
+#       'test_delta_t': dict(
+#           expr='supply - ret',
+#           inputs=dict(supply='test_supply_temp', ret='test_return_temp'),
+#       ),
+#       'test_btu_rate': dict(
+#           expr='500.0 * flow * (supply - ret)',
+#           inputs=dict(flow='test_flow', supply='test_supply_temp', ret='test_return_temp'),
+#           mode='interval',
+#       ),
+#   }
+VIRTUAL_SENSORS = {}
+
+# Alarm rules.  A reading that meets the alarm rule for its sensor is posted
+# immediately, ahead of other readings, instead of at the end of the logging
+# interval.  Keys are Sensor IDs or wildcard patterns; values are dictionaries
+# with any of these keys:
+#     'change': True to post every change in the sensor's value (e.g. for an
+#               outage or fault state).
+#     'high', 'low': post a reading that crosses above 'high' or below 'low',
+#               and the reading that returns to the normal range by more
+#               than 'deadband' (default 0).
+#     'max_rate': post a reading that changed faster than this many units per
+#               second since the prior reading.
+# For example:
+#   ALARM_RULES = {
+#       'test_power_out': dict(change=True),
+#       'test_boiler_supply': dict(high=200.0, low=60.0, deadband=2.0),
+#       'test_tank_level': dict(max_rate=0.5),
+#   }
+ALARM_RULES = {}
+
+# The readings collected during the current logging interval are saved to a
+# checkpoint file every CHECKPOINT_INTERVAL seconds, and are restored if the
+# logger restarts before the interval is logged.  Set to None to disable.
+# The default file is in /var/run, which is in RAM, so it survives restarts
+# of the logger program but not reboots of the Pi.  A file on the SD card
+# would also survive reboots, at the cost of more writes to the card.
+CHECKPOINT_INTERVAL = 60     # seconds
+CHECKPOINT_FILE = '/var/run/pi_logger_checkpoint.pkl'
+
+# Set to True to post performance metrics for the logger every logging
+# interval: read times, error and reading counts for each reader, time spent
+# logging, and read scheduling jitter.  Sensor IDs start with the LOGGER_ID,
+# e.g. 'test_rdr_sys_info_SysInfo_p99_ms'.  Regardless of this setting, the
+# metrics can be written to the log by sending the SIGUSR1 signal to the
+# pi_logger process:  sudo pkill -USR1 -f pi_logger.py
+PUBLISH_METRICS = False
+
+# Limits on the size of each message of summarized readings sent to the MQTT
+# broker, in number of readings and bytes.  A larger set of readings is split
+# into several messages.
+MQTT_CHUNK_READINGS = 1000
+MQTT_CHUNK_BYTES = 100000
+
 # ----------------------------------------------------
 
 # Set following to True to enable posting to a BMON server
@@ -24,8 +200,40 @@ ENABLE_BMON_POST = True
 POST_URL = '[BMON URL goes here]/readingdb/reading/store/'
 POST_STORE_KEY = 'Store Key Goes Here'
 
+# Readings received from the MQTT broker are written to the posting queue
+# in batches.  A batch is written when BMON_BATCH_SIZE messages have been
+# received or BMON_BATCH_WAIT seconds have passed, whichever comes first.
+BMON_BATCH_SIZE = 50     # messages
+BMON_BATCH_WAIT = 0.5    # seconds
+
+# Each post to the BMON server holds no more than BMON_CHUNK_READINGS
+# readings and about BMON_CHUNK_BYTES bytes.  Larger batches are split into
+# several posts, each of which is retried on its own if it fails.
+BMON_CHUNK_READINGS = 1000
+BMON_CHUNK_BYTES = 100000
+
+# Number of worker processes used to parse received messages.  0 parses
+# in a thread of the main process, which is recommended: parsing is cheap, and
+# sending the messages to worker processes and the readings back costs more
+# than the parsing itself unless there are several high-rate producers of
+# readings.
+BMON_PARSE_PROCESSES = 0
+
+# Seconds between log entries reporting the throughput and queue depth of
+# each stage of the posting pipeline.
+BMON_METRICS_INTERVAL = 600
+
+# Readings that are delivered more than once (same timestamp and sensor ID)
+# are only posted once.  Received readings are remembered for
+# BMON_DEDUP_WINDOW seconds, up to a maximum of BMON_DEDUP_MAX_ENTRIES readings.
+BMON_DEDUP_WINDOW = 3600         # seconds
+BMON_DEDUP_MAX_ENTRIES = 20000
+
 # A list of Sensor Reader classes goes here.
 # Comment out any Sensor Readers that are not being used.
+# At startup, the settings used by each reader are checked.  A reader with
+# invalid settings, or that uses the same serial port, I2C address or GPIO pin
+# as a reader earlier in the list, is not started; the problem is logged.
 READERS = [
 #'onewire.OneWire',               # 1-Wire Sensors using USB-to-DS2480B Adapter
 #'sage_boiler.Sage21Reader',      # Burnham Alpine Boilers w/ Sage 2.1 controller
@@ -43,6 +251,20 @@ READERS = [
 'sys_info.SysInfo',              # System uptime, CPU temperature, software version
 ]
 
+# Readers listed here are run in a separate process, so a reader that hangs
+# (e.g. waiting on a serial port or I2C device) cannot stop the other readers.
+# Keys are names from the READERS list above; values are the number of seconds
+# a read may take before the reader's process is killed and restarted.  A
+# value of None uses READ_INTERVAL.  Reads fail while a killed process is
+# being restarted.  A sandboxed reader keeps its read groups and counter
+# rollovers, but its read groups are read one at a time, and batched readings
+# are passed back as ordinary readings.  For example:
+#   SANDBOX_READERS = {
+#       'onewire.OneWire': 10.0,
+#       'dg700.DG700reader': None,
+#   }
+SANDBOX_READERS = {}
+
 # -------- Flags and Variables that control application health checks
 
 # These default values are appropriate for a system that is on a clock
@@ -172,6 +394,25 @@ METER_MULT_WATER = 1.0        # Water Meter Multiplier
 # Set to True to enable this reader
 ENABLE_RTL433_READER = False
 
+# -------------------- Current Reading Server -----------------------
+# See current_reading_server.py.  This server keeps the most recent raw
+# readings published to the "readings/raw/#" MQTT topics and serves them,
+# along with rolling statistics, through an HTTP server on the localhost
+# interface.
+
+# Set to True to enable the Current Reading Server
+ENABLE_CURRENT_READING_SERVER = False
+
+# Port on the localhost interface that the HTTP server listens on.
+CURRENT_READING_PORT = 8090
+
+# Number of seconds of recent readings kept for each sensor for calculating
+# rolling statistics.  The statistics are kept for time buckets that are
+# CURRENT_READING_BUCKET seconds long, and a statistics window is extended to
+# the start of the bucket it begins in.
+CURRENT_READING_HISTORY = 600
+CURRENT_READING_BUCKET = 10
+
 # -------------------- Power Monitor Script -----------------------
 # See power_monitor.py, script to read PZEM-016 electric power sensor.
 
@@ -315,6 +556,10 @@ MODBUS_TARGETS = (
 #                  'little' endian means the least-signficant word is the first address.
 #    device_addr:  This is the Modbus unit or device address of the device being read.
 #                  It defaults to 1, but can the value from 1 to 247.
+#    read_interval: Seconds between reads of this device.  Defaults to the read interval
+#                  of the reader (see READ_INTERVAL and READER_INTERVALS).
+#    read_offset:  Seconds after each read interval boundary on the clock that this
+#                  device is read, so that devices can be read at staggered times.
 #
 # For each Modbus device to be queried, there is a list of sensors or values to be read from the
 # device.  In the example above, 'device1_sensors' and 'device2_sensors' are two such lists (tuples 
@@ -395,6 +640,7 @@ MODBUS_RTU_TARGETS = (
 #    timeout: The number of seconds this computer will wait for a response from the device
 #             before timing out with an error.  Defaults to 1.0.
 #    baudrate:  The baudrate used for the serial port, defaults to 9600.
+#    read_interval, read_offset: Same as for the Modbus TCP reader above.
 
 # The sensor configuration, 'd1_sensors' in this example, is exactly as described in the Modbus
 # TCP setup before.
@@ -55,6 +55,13 @@ then
 fi
 
 
+# If requested, start the server that keeps the most recent raw reading from
+# each sensor and makes them available to local programs.
+if /home/pi/pi_logger/scripts/test_setting.py ENABLE_CURRENT_READING_SERVER
+then
+	/home/pi/pi_logger/scripts/run_current_reading_server &
+fi
+
 # Always start up pi_logger because it makes a status post to api.analysisnorth.com
 /home/pi/pi_logger/scripts/run_pi_logger &
 
@@ -0,0 +1,179 @@
+"""Tests of the accumulators in loglib.accumulate.  Run from the root of the
+repository with:
+
+    python3 -m pytest tests
+"""
+import numpy as np
+import pytest
+
+from loglib import accumulate
+
+# STATE readings for three logging intervals, as (ts, val).  The second
+# interval starts with the same state the first ended with, and the third
+# has no readings.
+STATE_INTERVALS = [
+    [(100.0, 0), (101.0, 0), (102.0, 1), (103.0, 1), (104.0, 0), (105.0, 0)],
+    [(106.0, 0), (107.0, 2), (108.0, 2), (109.0, 2), (110.0, 1), (111.0, 1)],
+    [],
+    [(113.0, 1), (114.0, 0)],
+]
+
+# ways to split a list of readings into the arrays passed to add_many()
+CHUNK_SIZES = [1, 2, 4, 100]
+
+def reference_state_summary(reading_id, reading_list, first_call):
+    """The STATE summarization done by the logger before the accumulators,
+    which stepped through the list of (ts, val) readings.  Returns the
+    summary and the reading list carried into the next interval.
+    """
+    special_ts = [reading_list[-1][0]]
+    if first_call:
+        special_ts.append(reading_list[0][0])
+    summary = []
+    last_state = reading_list[0][1]
+    for ts, val in reading_list:
+        if (val != last_state) or (ts in special_ts):
+            summary.append( (round(ts, 2), reading_id, val) )
+            last_state = val
+    return summary, [reading_list[-1]]
+
+def add_chunks(acc, readings, chunk_size):
+    """Adds the (ts, val) 'readings' to 'acc' with add_many(), 'chunk_size'
+    readings at a time.
+    """
+    for ix in range(0, len(readings), chunk_size):
+        chunk = readings[ix:ix + chunk_size]
+        acc.add_many(np.array([r[0] for r in chunk]), np.array([r[1] for r in chunk]))
+
+def state_summaries(add_func):
+    """Returns the summaries of STATE_INTERVALS from a StateAccumulator,
+    using 'add_func(acc, readings)' to add the readings of each interval and
+    carrying the accumulator into the next interval with next_interval().
+    """
+    summaries = []
+    acc = accumulate.StateAccumulator()
+    for interval, readings in enumerate(STATE_INTERVALS):
+        add_func(acc, readings)
+        summaries.append(acc.summarize('s', interval == 0))
+        acc = acc.next_interval() or accumulate.StateAccumulator()
+    return summaries
+
+def reference_state_summaries():
+    """Returns the summaries of STATE_INTERVALS from the reference
+    summarization, including the carry-over of the last reading.
+    """
+    summaries = []
+    carried = []
+    for interval, readings in enumerate(STATE_INTERVALS):
+        reading_list = carried + readings
+        summary, carried = reference_state_summary('s', reading_list, interval == 0)
+        summaries.append(summary)
+    return summaries
+
+
+def test_state_summaries_match_reference():
+    def add_each(acc, readings):
+        for ts, val in readings:
+            acc.add(ts, val)
+    assert state_summaries(add_each) == reference_state_summaries()
+
+@pytest.mark.parametrize('chunk_size', CHUNK_SIZES)
+def test_state_add_many_matches_reference(chunk_size):
+    summaries = state_summaries(lambda acc, readings: add_chunks(acc, readings, chunk_size))
+    assert summaries == reference_state_summaries()
+
+def test_state_first_call_includes_first_reading():
+    acc = accumulate.StateAccumulator()
+    for ts, val in [(10.0, 1), (11.0, 1), (12.0, 1)]:
+        acc.add(ts, val)
+    assert acc.summarize('s', True) == [(10.0, 's', 1), (12.0, 's', 1)]
+    assert acc.summarize('s', False) == [(12.0, 's', 1)]
+
+def test_state_carry_over_detects_first_change():
+    acc = accumulate.StateAccumulator()
+    acc.add(10.0, 1)
+    acc = acc.next_interval()
+    acc.add(11.0, 0)
+    assert acc.summarize('s', False) == [(11.0, 's', 0)]
+
+def test_state_carry_over_without_new_readings():
+    acc = accumulate.StateAccumulator()
+    acc.add(10.0, 1)
+    acc.add(11.0, 0)
+    acc = acc.next_interval()
+    assert acc.summarize('s', False) == [(11.0, 's', 0)]
+
+def test_state_stores_only_changes():
+    acc = accumulate.StateAccumulator()
+    add_chunks(acc, [(float(ts), 1) for ts in range(1000)] + [(1000.0, 0)], 64)
+    assert acc.changes == [(1000, 1000.0, 0)]
+    assert acc.count == 1001
+
+
+# VALUE readings for two logging intervals, with a gap in the second interval
+# longer than the time-weighted accumulator's 'max_gap'.
+VALUE_INTERVALS = [
+    [(200.0, 1.5), (202.0, 2.5), (203.5, -1.0), (207.0, 4.25), (208.0, 4.0), (210.0, 0.5)],
+    [(212.0, 3.0), (213.0, 3.5), (230.0, 1.0), (231.0, 2.0), (231.0, 2.5)],
+]
+
+# COUNTER readings for two logging intervals, with a rollover of a 16-bit
+# counter in the first interval and a reset in the second.
+COUNTER_INTERVALS = [
+    [(300.0, 65000.0), (301.0, 65400.0), (302.0, 200.0), (303.0, 900.0)],
+    [(304.0, 1500.0), (305.0, 40.0), (306.0, 90.0), (307.0, 1000.0)],
+]
+
+ACCUMULATOR_CASES = [
+    (lambda: accumulate.ValueAccumulator(), VALUE_INTERVALS),
+    (lambda: accumulate.ValueAccumulator(('min', 'max', 'std', 'twa', 'p90')), VALUE_INTERVALS),
+    (lambda: accumulate.TimeWeightedAccumulator(5.0, 20.0), VALUE_INTERVALS),
+    (lambda: accumulate.ChangeAccumulator(0.75, stats=('max',)), VALUE_INTERVALS),
+    (lambda: accumulate.StateAccumulator(), [[(ts, round(val)) for ts, val in readings] for readings in VALUE_INTERVALS]),
+    (lambda: accumulate.CounterAccumulator(), COUNTER_INTERVALS),
+    (lambda: accumulate.CounterRateAccumulator(2**16, 3600.0), COUNTER_INTERVALS),
+    (lambda: accumulate.CounterRateAccumulator(), COUNTER_INTERVALS),
+]
+
+def interval_summaries(make_acc, intervals, add_func):
+    """Returns the summaries of the readings in 'intervals' from accumulators
+    made by 'make_acc', using 'add_func(acc, readings)' to add each interval's
+    readings and next_interval() to carry into the next interval.
+    """
+    summaries = []
+    acc = make_acc()
+    for interval, readings in enumerate(intervals):
+        add_func(acc, readings)
+        summaries.append(acc.summarize('s', interval == 0))
+        acc = acc.next_interval() or make_acc()
+    return summaries
+
+@pytest.mark.parametrize('chunk_size', CHUNK_SIZES)
+@pytest.mark.parametrize('make_acc, intervals', ACCUMULATOR_CASES)
+def test_add_many_matches_add(make_acc, intervals, chunk_size):
+    def add_each(acc, readings):
+        for ts, val in readings:
+            acc.add(ts, val)
+    expected = interval_summaries(make_acc, intervals, add_each)
+    summaries = interval_summaries(make_acc, intervals, lambda acc, readings: add_chunks(acc, readings, chunk_size))
+    assert len(summaries) == len(expected)
+    for summary, expected_summary in zip(summaries, expected):
+        assert [(ts, reading_id) for ts, reading_id, val in summary] == [(ts, reading_id) for ts, reading_id, val in expected_summary]
+        assert [val for ts, reading_id, val in summary] == pytest.approx([val for ts, reading_id, val in expected_summary])
+
+def test_add_many_empty_arrays():
+    for make_acc, intervals in ACCUMULATOR_CASES:
+        acc = make_acc()
+        acc.add_many(np.array([]), np.array([]))
+        assert acc.count == 0
+        assert acc.summarize('s', True) == []
+
+def test_counter_rate_across_rollover_and_reset():
+    acc = accumulate.CounterRateAccumulator(2**16)
+    add_chunks(acc, COUNTER_INTERVALS[0], 100)
+    # 400 counts, then 336 across the rollover, then 700
+    assert acc.summarize('s', True)[1] == (303.0, 's_rate', float('%.5g' % (1436 / 3.0)))
+    acc = acc.next_interval()
+    add_chunks(acc, COUNTER_INTERVALS[1], 100)
+    # 600 counts, a reset counted from zero (40 counts), then 50 and 910
+    assert acc.summarize('s', False)[1] == (307.0, 's_rate', float('%.5g' % (1600 / 4.0)))
@@ -0,0 +1,93 @@
+"""Tests of the handling of ReadingBatch reads by the LoggerController.  Run
+from the root of the repository with:
+
+    python3 -m pytest tests
+"""
+import numpy as np
+import pytest
+
+import logger_controller
+from readers import base_reader
+from readers.base_reader import VALUE, STATE, COUNTER
+from readers.reading_batch import SensorTable, ReadingBatch
+
+class FakePoster:
+    """Substitutes for mqtt_poster.MQTTposter so no broker is needed.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.published = []
+
+    def start(self):
+        pass
+
+    def publish(self, topic, payload):
+        self.published.append((topic, payload))
+        return True
+
+
+class FakeReader(base_reader.Reader):
+
+    def read(self):
+        return []
+
+
+@pytest.fixture
+def make_controller(monkeypatch):
+    monkeypatch.setattr(logger_controller.mqtt_poster, 'MQTTposter', FakePoster)
+
+    def make(**settings):
+        st = base_reader.DummySettings()
+        st.CHECKPOINT_INTERVAL = 0
+        for name, val in settings.items():
+            setattr(st, name, val)
+        controller = logger_controller.LoggerController(1, 60, st)
+        reader = FakeReader(st)
+        controller.add_reader(reader, 'fake')
+        return controller, reader
+    return make
+
+def make_batch():
+    """Returns a batch with several readings of each sensor, not ordered by
+    sensor, and with a sensor that has a single reading.
+    """
+    table = SensorTable()
+    value_ix = table.index('val', VALUE)
+    state_ix = table.index('state', STATE)
+    counter_ix = table.index('count', COUNTER)
+    single_ix = table.index('single', VALUE)
+    indices = [state_ix, value_ix, counter_ix, value_ix, state_ix, single_ix,
+               counter_ix, value_ix, state_ix, counter_ix, state_ix]
+    values = [0, 1.5, 100, 2.5, 1, 7.25,
+              160, -3.0, 1, 250, 0]
+    ts = 1000.0 + np.arange(len(indices))
+    return ReadingBatch(table, ts, indices, values)
+
+def summaries(controller):
+    return {reading_id: acc.summarize(reading_id, True) for reading_id, acc in controller.read_data.items()}
+
+@pytest.mark.parametrize('settings', [
+    {},
+    {'COUNTER_RATE_SENSORS': {'count': {}}, 'VALUE_STATS': {'val': ('min', 'max', 'twa')}},
+    {'RAW_PUBLISH': True, 'TIME_WEIGHTED_SENSORS': {'val': {}}},
+])
+def test_batch_matches_readings(make_controller, settings):
+    batch_controller, batch_reader = make_controller(**settings)
+    list_controller, list_reader = make_controller(**settings)
+    batch = make_batch()
+    batch_controller.process_readings(batch_reader, batch)
+    list_controller.process_readings(list_reader, batch.readings())
+    expected = summaries(list_controller)
+    assert sorted(expected) == ['count', 'single', 'state', 'val']
+    assert summaries(batch_controller) == expected
+
+@pytest.mark.parametrize('as_batch', [False, True])
+def test_raw_publish_error_does_not_fail_read(make_controller, as_batch):
+    controller, reader = make_controller(RAW_PUBLISH=True)
+
+    def publish(topic, payload):
+        raise RuntimeError('MQTT client is disconnected')
+    controller.raw_poster.publish = publish
+    batch = make_batch()
+    controller.process_readings(reader, batch if as_batch else batch.readings())
+    assert sorted(controller.read_data) == ['count', 'single', 'state', 'val']
@@ -0,0 +1,31 @@
+"""Tests of the expression checks in loglib.virtual_sensors.  Run from the
+root of the repository with:
+
+    python3 -m pytest tests
+"""
+import pytest
+
+from loglib.virtual_sensors import VirtualSensor
+
+INPUTS = {'a': 'sensor_a', 'b': 'sensor_b'}
+
+@pytest.mark.parametrize('expr', [
+    'a - b',
+    'np.mean(a) + np.pi',
+    'max(a, b)',
+    'np.where(a > b, a, b)',
+    'round(abs(a))',
+])
+def test_valid_expressions(expr):
+    VirtualSensor('v', expr, INPUTS).evaluate({'a': 1.0, 'b': 2.0})
+
+@pytest.mark.parametrize('expr, unknown', [
+    ('mean(a)', 'mean'),
+    ('pi * a', 'pi'),
+    ('sum(a, b)', 'sum'),
+    ('np.nosuch(a)', 'np.nosuch'),
+    ('a + c', 'c'),
+])
+def test_unknown_names_rejected(expr, unknown):
+    with pytest.raises(ValueError, match=unknown):
+        VirtualSensor('v', expr, INPUTS)